@@ -1,34 +1,51 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, asc, and_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, desc, asc, func
+from sqlalchemy.orm import joinedload, selectinload
 from fastapi import HTTPException, status
 from typing import Optional
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from database.tenant_db import TenantDatabase
 from models.tenant_models import Order, OrderItem, MenuItem, Menu, Session as ChatSession, Message, Settings, OrderStatus, PaymentStatus
-from models.main_models import Restaurant
+from services.restaurant_directory import restaurant_directory
+from services.menu_cache import menu_cache
+from services.order_metrics import order_metrics, order_state
 from schemas.admin_schemas import OrderUpdate, SessionUpdate, MenuItemCreate, MenuItemUpdate, MenuCreate, MenuUpdate
 from utils.auth import verify_token
+from utils.pagination import encode_cursor, keyset_filter, estimate_table_rows, count_rows, COUNT_ESTIMATE_CAP
 import json
 
 class AdminController:
     @staticmethod
-    def get_tenant_db_by_token(token: str, main_db: Session) -> TenantDatabase:
+    async def get_tenant_db_by_token(token: str, main_db: AsyncSession) -> TenantDatabase:
         """Get tenant database from JWT token"""
         payload = verify_token(token)
         restaurant_id = payload.get("sub")
         
-        restaurant = main_db.query(Restaurant).filter(Restaurant.id == restaurant_id).first()
+        restaurant = await restaurant_directory.get_by_id(restaurant_id, main_db)
         if not restaurant:
             raise HTTPException(status_code=404, detail="Restaurant not found")
         
-        from database.tenant_db import get_tenant_db_from_url
-        return get_tenant_db_from_url(restaurant.db_url)
+        from database.tenant_db import aget_tenant_db_from_url
+        return await aget_tenant_db_from_url(restaurant["db_url"])
 
     @staticmethod
-    def get_orders(
+    def _menu_changed(token: str):
+        """Bump the tenant's menu revision after a menu item write"""
+        menu_cache.bump(verify_token(token).get("sub"))
+
+    @staticmethod
+    def _order_load_options():
+        """Eager-load an order's session and items (with menu items) in a fixed number of queries"""
+        return (
+            joinedload(Order.session),
+            selectinload(Order.items).joinedload(OrderItem.menu_item),
+        )
+
+    @staticmethod
+    async def get_orders(
         token: str,
-        main_db: Session,
+        main_db: AsyncSession,
         page: int = 1,
         limit: int = 20,
         status: Optional[str] = None,
@@ -38,14 +55,24 @@ class AdminController:
         search: Optional[str] = None,
         date_from: Optional[datetime] = None,
         date_to: Optional[datetime] = None,
+        cursor: Optional[str] = None,
+        count: str = "exact",
     ):
-        """Get orders with filtering and pagination"""
+        """Get orders with filtering and pagination.
+        
+        Sorting by created_at supports keyset pagination: pass the returned
+        ``next_cursor`` back as ``cursor`` to fetch the following page at the
+        same cost as the first. ``count`` selects how ``total`` is computed:
+        ``exact``, ``estimate`` (planner statistics, or a capped count when
+        filtered) or ``none``.
+        """
         
-        tenant_db = AdminController.get_tenant_db_by_token(token, main_db)
+        tenant_db = await AdminController.get_tenant_db_by_token(token, main_db)
         
-        db = tenant_db.get_session()
+        db = tenant_db.get_async_session()
         try:
-            query = db.query(Order)
+            query = select(Order)
+            filtered = bool(status or payment_status or date_from or date_to or search)
             
             # Apply filters
             if status:
@@ -69,29 +96,54 @@ class AdminController:
                     ).ilike(f"%{search}%")
                 )
             
-            # Apply sorting
-            sort_column = getattr(Order, sort_by, Order.created_at)
+            # Apply sorting (id breaks ties so keyset positions are unique)
+            sort_column = Order.__table__.c.get(sort_by, Order.created_at)
+            keyset = sort_column is Order.__table__.c.created_at
+            if cursor and not keyset:
+                raise HTTPException(status_code=400, detail="Cursor pagination requires sort_by=created_at")
             if sort_order == "desc":
-                query = query.order_by(desc(sort_column))
+                query = query.order_by(desc(sort_column), desc(Order.id))
             else:
-                query = query.order_by(asc(sort_column))
+                query = query.order_by(asc(sort_column), asc(Order.id))
             
             # Get total count
-            total = query.count()
-            
-            # Apply pagination
-            orders = query.offset((page - 1) * limit).limit(limit).all()
+            total, total_estimated = None, False
+            if count == "exact":
+                total = await count_rows(db, query)
+            elif count == "estimate":
+                if not filtered:
+                    total = await estimate_table_rows(db, "orders", tenant_db.schema)
+                if not total:
+                    total = await count_rows(db, query, cap=COUNT_ESTIMATE_CAP)
+                total_estimated = True
+            
+            # Apply pagination, eager-loading sessions and items for the whole page
+            if cursor:
+                page_query = query.filter(
+                    keyset_filter(Order.created_at, Order.id, cursor, descending=sort_order == "desc")
+                )
+            else:
+                page_query = query.offset((page - 1) * limit)
+            result = await db.execute(
+                page_query.options(*AdminController._order_load_options()).limit(limit + 1)
+            )
+            orders = result.unique().scalars().all()
+            has_more = len(orders) > limit
+            orders = orders[:limit]
+            
+            # Proof images that also appear on other orders, in one grouped query for the page
+            page_hashes = {order.payment_proof_hash for order in orders if order.payment_proof_hash}
+            reused_hashes = set()
+            if page_hashes:
+                reused_hashes = set((await db.execute(
+                    select(Order.payment_proof_hash).filter(Order.payment_proof_hash.in_(page_hashes))
+                    .group_by(Order.payment_proof_hash).having(func.count() > 1)
+                )).scalars().all())
             
             # Format response
             orders_data = []
             for order in orders:
-                # Get session info
-                session = db.query(ChatSession).filter(ChatSession.id == order.session_id).first()
-                
-                # Get order items
-                items = db.query(OrderItem, MenuItem).join(MenuItem).filter(
-                    OrderItem.order_id == order.id
-                ).all()
+                session = order.session
                 
                 orders_data.append({
                     "id": str(order.id),
@@ -102,6 +154,8 @@ class AdminController:
                     "updated_at": order.updated_at.isoformat(),
                     "payment_proof_text": order.payment_proof_text,
                     "payment_proof_image_url": order.payment_proof_image_url,
+                    "payment_proof_hash": order.payment_proof_hash,
+                    "payment_proof_reused": order.payment_proof_hash in reused_hashes,
                     "customer": {
                         "name": session.customer_name if session else None,
                         "phone": session.customer_phone if session else None,
@@ -110,42 +164,57 @@ class AdminController:
                         "notes": session.notes if session else None
                     },
                     "items": [{
-                        "id": str(item.OrderItem.id),
-                        "name": item.MenuItem.name,
-                        "quantity": item.OrderItem.quantity,
-                        "unit_price": float(item.OrderItem.unit_price),
-                        "line_total": float(item.OrderItem.quantity * item.OrderItem.unit_price)
-                    } for item in items]
+                        "id": str(item.id),
+                        "name": item.menu_item.name,
+                        "quantity": item.quantity,
+                        "unit_price": float(item.unit_price),
+                        "discount": float(item.discount or 0),
+                        "options": item.get_options(),
+                        "line_total": float(item.quantity * item.unit_price - (item.discount or 0))
+                    } for item in order.items]
                 })
             
+            next_cursor = None
+            if keyset and has_more and orders:
+                next_cursor = encode_cursor(orders[-1].created_at, orders[-1].id)
+            
             return {
                 "orders": orders_data,
                 "total": total,
+                "total_estimated": total_estimated,
                 "page": page,
                 "limit": limit,
-                "pages": (total + limit - 1) // limit
+                "pages": (total + limit - 1) // limit if total is not None else None,
+                "next_cursor": next_cursor,
+                "has_more": has_more
             }
             
         finally:
-            db.close()
+            await db.close()
 
     @staticmethod
-    def get_order_detail(token: str, main_db: Session, order_id: str):
+    async def get_order_detail(token: str, main_db: AsyncSession, order_id: str):
         """Get detailed order information"""
         
-        tenant_db = AdminController.get_tenant_db_by_token(token, main_db)
+        tenant_db = await AdminController.get_tenant_db_by_token(token, main_db)
         
-        db = tenant_db.get_session()
+        db = tenant_db.get_async_session()
         try:
-            order = db.query(Order).filter(Order.id == order_id).first()
+            result = await db.execute(
+                select(Order).options(*AdminController._order_load_options()).filter(Order.id == order_id)
+            )
+            order = result.unique().scalars().first()
             if not order:
                 raise HTTPException(status_code=404, detail="Order not found")
             
-            # Get session and items
-            session = db.query(ChatSession).filter(ChatSession.id == order.session_id).first()
-            items = db.query(OrderItem, MenuItem).join(MenuItem).filter(
-                OrderItem.order_id == order.id
-            ).all()
+            session = order.session
+            
+            # Other orders paid with the same proof image
+            reused_by = []
+            if order.payment_proof_hash:
+                reused_by = [str(other_id) for other_id in (await db.execute(
+                    select(Order.id).filter(Order.payment_proof_hash == order.payment_proof_hash, Order.id != order.id)
+                )).scalars().all()]
             
             return {
                 "id": str(order.id),
@@ -156,6 +225,8 @@ class AdminController:
                 "updated_at": order.updated_at.isoformat(),
                 "payment_proof_text": order.payment_proof_text,
                 "payment_proof_image_url": order.payment_proof_image_url,
+                "payment_proof_hash": order.payment_proof_hash,
+                "payment_proof_reused_by": reused_by,
                 "customer": {
                     "name": session.customer_name if session else None,
                     "phone": session.customer_phone if session else None,
@@ -164,38 +235,44 @@ class AdminController:
                     "notes": session.notes if session else None
                 },
                 "items": [{
-                    "id": str(item.OrderItem.id),
-                    "name": item.MenuItem.name,
-                    "description": item.MenuItem.description,
-                    "quantity": item.OrderItem.quantity,
-                    "unit_price": float(item.OrderItem.unit_price),
-                    "line_total": float(item.OrderItem.quantity * item.OrderItem.unit_price)
-                } for item in items]
+                    "id": str(item.id),
+                    "name": item.menu_item.name,
+                    "description": item.menu_item.description,
+                    "quantity": item.quantity,
+                    "unit_price": float(item.unit_price),
+                    "discount": float(item.discount or 0),
+                    "options": item.get_options(),
+                    "line_total": float(item.quantity * item.unit_price - (item.discount or 0))
+                } for item in order.items]
             }
             
         finally:
-            db.close()
+            await db.close()
 
     @staticmethod
-    def update_order(token: str, main_db: Session, order_id: str, update_data: OrderUpdate):
+    async def update_order(token: str, main_db: AsyncSession, order_id: str, update_data: OrderUpdate):
         """Update order status or payment status"""
         
-        tenant_db = AdminController.get_tenant_db_by_token(token, main_db)
+        tenant_db = await AdminController.get_tenant_db_by_token(token, main_db)
         
-        db = tenant_db.get_session()
+        db = tenant_db.get_async_session()
         try:
-            order = db.query(Order).filter(Order.id == order_id).first()
+            result = await db.execute(select(Order).filter(Order.id == order_id))
+            order = result.scalars().first()
             if not order:
                 raise HTTPException(status_code=404, detail="Order not found")
             
             # Update fields
+            before = order_state(order)
             if update_data.status:
                 order.status = OrderStatus(update_data.status)
             if update_data.payment_status:
                 order.payment_status = PaymentStatus(update_data.payment_status)
             
             order.updated_at = datetime.utcnow()
-            db.commit()
+            after = order_state(order)
+            await db.commit()
+            order_metrics.record_change(verify_token(token).get("sub"), before, after)
             
             # If marking as paid and confirmed, send bot message
             if (update_data.payment_status == "paid" and 
@@ -207,71 +284,39 @@ class AdminController:
                     content="Your order has been confirmed! We'll start preparing it shortly."
                 )
                 db.add(bot_message)
-                db.commit()
+                await db.commit()
             
             return {"message": "Order updated successfully"}
             
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
         finally:
-            db.close()
+            await db.close()
 
     @staticmethod
-    def get_24h_metrics(token: str, main_db: Session):
+    async def get_24h_metrics(token: str, main_db: AsyncSession):
         """Get 24-hour rolling metrics"""
         
-        tenant_db = AdminController.get_tenant_db_by_token(token, main_db)
+        tenant_db = await AdminController.get_tenant_db_by_token(token, main_db)
         
-        db = tenant_db.get_session()
+        db = tenant_db.get_async_session()
         try:
-            now = datetime.utcnow()
-            yesterday = now - timedelta(hours=24)
-            
-            # Revenue (paid orders last 24h)
-            revenue_result = db.query(func.coalesce(func.sum(Order.total_price), 0)).filter(
-                and_(
-                    Order.payment_status == PaymentStatus.paid,
-                    Order.created_at >= yesterday
-                )
-            ).scalar()
-            
-            # Delivered orders last 24h
-            delivered_count = db.query(func.count(Order.id)).filter(
-                and_(
-                    Order.status == OrderStatus.delivered,
-                    Order.updated_at >= yesterday
-                )
-            ).scalar()
-            
-            # Total orders last 24h
-            total_orders = db.query(func.count(Order.id)).filter(
-                Order.created_at >= yesterday
-            ).scalar()
-            
-            # Pending orders (current)
-            pending_orders = db.query(func.count(Order.id)).filter(
-                Order.status.in_([OrderStatus.pending, OrderStatus.confirmed, OrderStatus.in_process])
-            ).scalar()
-            
-            return {
-                "revenue_24h": float(revenue_result or 0),
-                "delivered_24h": delivered_count or 0,
-                "total_orders_24h": total_orders or 0,
-                "pending_orders": pending_orders or 0
-            }
+            # Served from counters kept current by order writes; one aggregate query when they need a resync
+            return await order_metrics.get(verify_token(token).get("sub"), db)
             
         finally:
-            db.close()
+            await db.close()
 
     @staticmethod
-    def update_session(token: str, main_db: Session, session_id: str, update_data: SessionUpdate):
+    async def update_session(token: str, main_db: AsyncSession, session_id: str, update_data: SessionUpdate):
         """Update session/customer details"""
         
-        tenant_db = AdminController.get_tenant_db_by_token(token, main_db)
+        tenant_db = await AdminController.get_tenant_db_by_token(token, main_db)
         
-        db = tenant_db.get_session()
+        db = tenant_db.get_async_session()
         try:
-            session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+            result = await db.execute(select(ChatSession).filter(ChatSession.id == session_id))
+            session = result.scalars().first()
             if not session:
                 raise HTTPException(status_code=404, detail="Session not found")
             
@@ -280,21 +325,22 @@ class AdminController:
                 setattr(session, field, value)
             
             session.updated_at = datetime.utcnow()
-            db.commit()
+            await db.commit()
             
             return {"message": "Session updated successfully"}
             
         finally:
-            db.close()
+            await db.close()
 
     @staticmethod
-    def get_menus(token: str, main_db: Session):
+    async def get_menus(token: str, main_db: AsyncSession):
         """Get all menus for the restaurant"""
-        tenant_db = AdminController.get_tenant_db_by_token(token, main_db)
+        tenant_db = await AdminController.get_tenant_db_by_token(token, main_db)
         
-        db = tenant_db.get_session()
+        db = tenant_db.get_async_session()
         try:
-            menus = db.query(Menu).all()
+            result = await db.execute(select(Menu))
+            menus = result.scalars().all()
             return [{
                 "id": str(menu.id),
                 "name": menu.name,
@@ -303,22 +349,22 @@ class AdminController:
                 "updated_at": menu.updated_at.isoformat()
             } for menu in menus]
         finally:
-            db.close()
+            await db.close()
 
     @staticmethod
-    def create_menu(token: str, main_db: Session, menu_data: MenuCreate):
+    async def create_menu(token: str, main_db: AsyncSession, menu_data: MenuCreate):
         """Create a new menu"""
-        tenant_db = AdminController.get_tenant_db_by_token(token, main_db)
+        tenant_db = await AdminController.get_tenant_db_by_token(token, main_db)
         
-        db = tenant_db.get_session()
+        db = tenant_db.get_async_session()
         try:
             menu = Menu(
                 name=menu_data.name,
                 description=menu_data.description
             )
             db.add(menu)
-            db.commit()
-            db.refresh(menu)
+            await db.commit()
+            await db.refresh(menu)
             
             return {
                 "id": str(menu.id),
@@ -328,20 +374,21 @@ class AdminController:
                 "updated_at": menu.updated_at.isoformat()
             }
         finally:
-            db.close()
+            await db.close()
 
     @staticmethod
-    def get_menu_items(token: str, main_db: Session, menu_id: Optional[str] = None):
+    async def get_menu_items(token: str, main_db: AsyncSession, menu_id: Optional[str] = None):
         """Get menu items, optionally filtered by menu"""
-        tenant_db = AdminController.get_tenant_db_by_token(token, main_db)
+        tenant_db = await AdminController.get_tenant_db_by_token(token, main_db)
         
-        db = tenant_db.get_session()
+        db = tenant_db.get_async_session()
         try:
-            query = db.query(MenuItem)
+            query = select(MenuItem)
             if menu_id:
                 query = query.filter(MenuItem.menu_id == menu_id)
             
-            items = query.all()
+            result = await db.execute(query)
+            items = result.scalars().all()
             return [{
                 "id": str(item.id),
                 "menu_id": str(item.menu_id),
@@ -362,17 +409,18 @@ class AdminController:
                 "updated_at": item.updated_at.isoformat()
             } for item in items]
         finally:
-            db.close()
+            await db.close()
 
     @staticmethod
-    def create_menu_item(token: str, main_db: Session, menu_id: str, item_data: MenuItemCreate):
+    async def create_menu_item(token: str, main_db: AsyncSession, menu_id: str, item_data: MenuItemCreate):
         """Create a new menu item"""
-        tenant_db = AdminController.get_tenant_db_by_token(token, main_db)
+        tenant_db = await AdminController.get_tenant_db_by_token(token, main_db)
         
-        db = tenant_db.get_session()
+        db = tenant_db.get_async_session()
         try:
             # Verify menu exists
-            menu = db.query(Menu).filter(Menu.id == menu_id).first()
+            result = await db.execute(select(Menu).filter(Menu.id == menu_id))
+            menu = result.scalars().first()
             if not menu:
                 raise HTTPException(status_code=404, detail="Menu not found")
             
@@ -393,8 +441,9 @@ class AdminController:
                 servings=json.dumps([serving.dict() for serving in item_data.servings]) if item_data.servings else None
             )
             db.add(item)
-            db.commit()
-            db.refresh(item)
+            await db.commit()
+            await db.refresh(item)
+            AdminController._menu_changed(token)
             
             return {
                 "id": str(item.id),
@@ -416,16 +465,17 @@ class AdminController:
                 "updated_at": item.updated_at.isoformat()
             }
         finally:
-            db.close()
+            await db.close()
 
     @staticmethod
-    def update_menu_item(token: str, main_db: Session, item_id: str, item_data: MenuItemUpdate):
+    async def update_menu_item(token: str, main_db: AsyncSession, item_id: str, item_data: MenuItemUpdate):
         """Update a menu item"""
-        tenant_db = AdminController.get_tenant_db_by_token(token, main_db)
+        tenant_db = await AdminController.get_tenant_db_by_token(token, main_db)
         
-        db = tenant_db.get_session()
+        db = tenant_db.get_async_session()
         try:
-            item = db.query(MenuItem).filter(MenuItem.id == item_id).first()
+            result = await db.execute(select(MenuItem).filter(MenuItem.id == item_id))
+            item = result.scalars().first()
             if not item:
                 raise HTTPException(status_code=404, detail="Menu item not found")
             
@@ -442,26 +492,29 @@ class AdminController:
                     setattr(item, field, value)
             
             item.updated_at = datetime.utcnow()
-            db.commit()
+            await db.commit()
+            AdminController._menu_changed(token)
             
             return {"message": "Menu item updated successfully"}
         finally:
-            db.close()
+            await db.close()
 
     @staticmethod
-    def delete_menu_item(token: str, main_db: Session, item_id: str):
+    async def delete_menu_item(token: str, main_db: AsyncSession, item_id: str):
         """Delete a menu item"""
-        tenant_db = AdminController.get_tenant_db_by_token(token, main_db)
+        tenant_db = await AdminController.get_tenant_db_by_token(token, main_db)
         
-        db = tenant_db.get_session()
+        db = tenant_db.get_async_session()
         try:
-            item = db.query(MenuItem).filter(MenuItem.id == item_id).first()
+            result = await db.execute(select(MenuItem).filter(MenuItem.id == item_id))
+            item = result.scalars().first()
             if not item:
                 raise HTTPException(status_code=404, detail="Menu item not found")
             
-            db.delete(item)
-            db.commit()
+            await db.delete(item)
+            await db.commit()
+            AdminController._menu_changed(token)
             
             return {"message": "Menu item deleted successfully"}
         finally:
-            db.close()
\ No newline at end of file
+            await db.close()
\ No newline at end of file
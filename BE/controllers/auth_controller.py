@@ -1,23 +1,26 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from fastapi import HTTPException, status
-import bcrypt
 import secrets
 from datetime import datetime, timedelta
 
-from models.main_models import Restaurant, AdminOTP, SuperAdmin
+from models.main_models import Restaurant, SuperAdmin
 from schemas.auth_schemas import LoginRequest, OTPVerifyRequest, SuperAdminLoginRequest
 from utils.auth import create_access_token
+from utils.crypto import verify_secret
 from utils.email import send_otp_email
+from utils.otp_store import get_otp_store
 
 class AuthController:
     @staticmethod
-    async def restaurant_login(request: LoginRequest, db: Session):
+    async def restaurant_login(request: LoginRequest, db: AsyncSession):
         """Step 1: Validate restaurant admin credentials and send OTP"""
         
         # Find restaurant admin
-        restaurant = db.query(Restaurant).filter(
-            Restaurant.admin_username == request.username
-        ).first()
+        result = await db.execute(
+            select(Restaurant).filter(Restaurant.admin_username == request.username)
+        )
+        restaurant = result.scalars().first()
         
         if not restaurant:
             raise HTTPException(
@@ -26,7 +29,7 @@ class AuthController:
             )
         
         # Verify password
-        if not bcrypt.checkpw(request.password.encode('utf-8'), restaurant.admin_password_hash.encode('utf-8')):
+        if not await verify_secret(request.password, restaurant.admin_password_hash):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid username or password"
@@ -34,19 +37,11 @@ class AuthController:
         
         # Generate and send OTP
         otp_code = secrets.randbelow(900000) + 100000  # 6-digit code
-        otp_hash = bcrypt.hashpw(str(otp_code).encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        expires_at = datetime.utcnow() + timedelta(minutes=10)
-        
-        # Store OTP in database
-        otp_record = AdminOTP(
-            restaurant_id=restaurant.id,
-            code_hash=otp_hash,
-            expires_at=expires_at
-        )
-        db.add(otp_record)
-        db.commit()
         
-        # Send OTP via email
+        # Keep only its keyed digest; it expires on its own and replaces any earlier code
+        await get_otp_store().issue(str(restaurant.id), str(otp_code))
+        
+        # Queue OTP email; login returns without waiting for SMTP
         try:
             await send_otp_email(restaurant.admin_email, otp_code, restaurant.name)
         except Exception as e:
@@ -58,13 +53,14 @@ class AuthController:
         return {"message": "OTP sent to registered email", "username": request.username}
 
     @staticmethod
-    async def verify_restaurant_otp(request: OTPVerifyRequest, db: Session):
+    async def verify_restaurant_otp(request: OTPVerifyRequest, db: AsyncSession):
         """Step 2: Verify OTP and issue JWT token for restaurant admin"""
         
         # Find restaurant
-        restaurant = db.query(Restaurant).filter(
-            Restaurant.admin_username == request.username
-        ).first()
+        result = await db.execute(
+            select(Restaurant).filter(Restaurant.admin_username == request.username)
+        )
+        restaurant = result.scalars().first()
         
         if not restaurant:
             raise HTTPException(
@@ -72,30 +68,13 @@ class AuthController:
                 detail="Invalid username"
             )
         
-        # Find valid OTP
-        otp_record = db.query(AdminOTP).filter(
-            AdminOTP.restaurant_id == restaurant.id,
-            AdminOTP.used == False,
-            AdminOTP.expires_at > datetime.utcnow()
-        ).first()
-        
-        if not otp_record:
+        # Verify and consume OTP (single use, limited attempts)
+        if not await get_otp_store().verify(str(restaurant.id), request.otp):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid or expired OTP"
             )
         
-        # Verify OTP
-        if not bcrypt.checkpw(request.otp.encode('utf-8'), otp_record.code_hash.encode('utf-8')):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid OTP"
-            )
-        
-        # Mark OTP as used
-        otp_record.used = True
-        db.commit()
-        
         # Create JWT token
         token_data = {
             "sub": str(restaurant.id),
@@ -119,13 +98,14 @@ class AuthController:
         }
 
     @staticmethod
-    async def super_admin_login(request: SuperAdminLoginRequest, db: Session):
+    async def super_admin_login(request: SuperAdminLoginRequest, db: AsyncSession):
         """Super admin login"""
         
         # Find super admin
-        super_admin = db.query(SuperAdmin).filter(
-            SuperAdmin.username == request.username
-        ).first()
+        result = await db.execute(
+            select(SuperAdmin).filter(SuperAdmin.username == request.username)
+        )
+        super_admin = result.scalars().first()
         
         if not super_admin:
             raise HTTPException(
@@ -134,7 +114,7 @@ class AuthController:
             )
         
         # Verify password
-        if not bcrypt.checkpw(request.password.encode('utf-8'), super_admin.password_hash.encode('utf-8')):
+        if not await verify_secret(request.password, super_admin.password_hash):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid username or password"
@@ -1,16 +1,21 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, func
 from fastapi import HTTPException, status
-import bcrypt
 from datetime import datetime
 from typing import Optional
 
 from models.main_models import Restaurant
+from database.tenant_db import invalidate_tenant_db
+from services.restaurant_directory import restaurant_directory
+from services.ai_service import invalidate_ai_service
+from services.menu_cache import menu_cache
+from services.intent_router import intent_router
+from utils.crypto import hash_secret, crypto_executor
 from schemas.restaurant_schemas import RestaurantCreate, RestaurantUpdate, RestaurantResponse
 
 class SuperAdminController:
     @staticmethod
-    def create_restaurant(restaurant_data: RestaurantCreate, db: Session) -> RestaurantResponse:
+    async def create_restaurant(restaurant_data: RestaurantCreate, db: Session) -> RestaurantResponse:
         """Create a new restaurant"""
         
         # Check if slug already exists
@@ -36,10 +41,7 @@ class SuperAdminController:
             )
         
         # Hash password
-        password_hash = bcrypt.hashpw(
-            restaurant_data.admin_password.encode('utf-8'), 
-            bcrypt.gensalt()
-        ).decode('utf-8')
+        password_hash = await hash_secret(restaurant_data.admin_password)
         
         # Create restaurant
         restaurant = Restaurant(
@@ -60,6 +62,9 @@ class SuperAdminController:
         db.commit()
         db.refresh(restaurant)
         
+        # Public restaurant listings are cached on every worker
+        restaurant_directory.invalidate(str(restaurant.id))
+        
         return RestaurantResponse(
             id=str(restaurant.id),
             slug=restaurant.slug,
@@ -163,6 +168,8 @@ class SuperAdminController:
                 detail="Restaurant not found"
             )
         
+        previous_db_url = restaurant.db_url
+        
         # Update fields
         for field, value in update_data.dict(exclude_unset=True).items():
             setattr(restaurant, field, value)
@@ -171,6 +178,13 @@ class SuperAdminController:
         db.commit()
         db.refresh(restaurant)
         
+        restaurant_directory.invalidate(str(restaurant.id))
+        
+        # Drop pooled connections to a database the tenant no longer uses
+        if restaurant.db_url != previous_db_url:
+            invalidate_tenant_db(previous_db_url)
+            menu_cache.invalidate(str(restaurant.id))
+        
         return RestaurantResponse(
             id=str(restaurant.id),
             slug=restaurant.slug,
@@ -196,7 +210,23 @@ class SuperAdminController:
                 detail="Restaurant not found"
             )
         
+        cached_id, db_url = str(restaurant.id), restaurant.db_url
         db.delete(restaurant)
         db.commit()
         
-        return {"message": "Restaurant deleted successfully"}
\ No newline at end of file
+        restaurant_directory.invalidate(cached_id)
+        invalidate_ai_service(cached_id)
+        menu_cache.invalidate(cached_id)
+        invalidate_tenant_db(db_url)
+        
+        return {"message": "Restaurant deleted successfully"}
+
+    @staticmethod
+    def get_intent_router_stats():
+        """Fast-path hit rate and estimated LLM latency saved (this worker)"""
+        return intent_router.stats()
+
+    @staticmethod
+    def get_crypto_stats():
+        """Password/OTP hashing pool load (this worker)"""
+        return crypto_executor.stats()
@@ -1,139 +1,178 @@
-from sqlalchemy.orm import Session
-from fastapi import HTTPException, status, UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from fastapi import HTTPException, status, UploadFile, Request
+from fastapi.responses import StreamingResponse
 from typing import Optional
+import asyncio
 import uuid
+import json
 from datetime import datetime
 
 from database.tenant_db import TenantDatabase
-from models.tenant_models import Session as ChatSession, Message, MenuItem, MessageSender
-from models.main_models import Restaurant
+from models.tenant_models import Session as ChatSession, Message, MessageSender, TokenUsage
 from schemas.tenant_schemas import ChatMessage, ChatResponse, SessionResponse
-from services.ai_service import AIService
-from services.image_service import upload_image
-from utils.rate_limit import check_rate_limit
-import json
+from services.ai_service import get_ai_service, AI_MODEL
+from services.context_builder import estimate_tokens
+from services.image_service import upload_image, UploadTooLarge, InvalidImage
+from services.restaurant_directory import restaurant_directory
+from services.menu_cache import menu_cache
+from utils.rate_limit import check_rate_limit, record_token_usage
+from utils.pagination import encode_cursor, keyset_filter
+from utils.http_cache import json_body, cached_json_response
+
+# Strong references to fire-and-forget tasks so they are not garbage-collected mid-run
+_background_tasks = set()
+
+def _sse(event: dict) -> str:
+    """Format an event as a Server-Sent Events frame"""
+    return f"data: {json.dumps(event)}\n\n"
 
 class TenantController:
     @staticmethod
-    def get_tenant_db_by_slug(slug: str, main_db: Session):
-        """Get tenant database by restaurant slug"""
-        restaurant = main_db.query(Restaurant).filter(Restaurant.slug == slug).first()
+    async def get_tenant_db_by_slug(slug: str, main_db: AsyncSession):
+        """Get tenant database and cached restaurant entry by restaurant slug"""
+        restaurant = await restaurant_directory.get_by_slug(slug, main_db)
         if not restaurant:
             raise HTTPException(status_code=404, detail="Restaurant not found")
         
-        from database.tenant_db import get_tenant_db_from_url
-        return get_tenant_db_from_url(restaurant.db_url), restaurant
+        from database.tenant_db import aget_tenant_db_from_url
+        return await aget_tenant_db_from_url(restaurant["db_url"]), restaurant
 
     @staticmethod
-    def list_restaurants(main_db: Session):
-        """Get list of all restaurants"""
-        restaurants = main_db.query(Restaurant).all()
-        return [{
-            "slug": restaurant.slug,
-            "name": restaurant.name,
-            "id": str(restaurant.id),
-            "description": restaurant.description or f"Delicious food from {restaurant.name}",
-            "location": restaurant.location or "City Center",
-            "image": restaurant.image_url or "https://images.pexels.com/photos/958545/pexels-photo-958545.jpeg?auto=compress&cs=tinysrgb&w=800"
-        } for restaurant in restaurants]
+    async def list_restaurants(request: Request, main_db: AsyncSession):
+        """Get list of all restaurants, answering 304 when the client's copy is current"""
+        restaurants = await restaurant_directory.get_all(main_db)
+        body = json_body([{
+            "slug": restaurant["slug"],
+            "name": restaurant["name"],
+            "id": restaurant["id"],
+            "description": restaurant["description"] or f"Delicious food from {restaurant['name']}",
+            "location": restaurant["location"] or "City Center",
+            "image": restaurant["image_url"] or "https://images.pexels.com/photos/958545/pexels-photo-958545.jpeg?auto=compress&cs=tinysrgb&w=800"
+        } for restaurant in restaurants])
+        return cached_json_response(request, body)
 
     @staticmethod
-    def create_session(slug: str, main_db: Session) -> SessionResponse:
+    async def create_session(slug: str, main_db: AsyncSession) -> SessionResponse:
         """Create a new chat session for a restaurant"""
-        restaurant = main_db.query(Restaurant).filter(Restaurant.slug == slug).first()
-        if not restaurant:
-            raise HTTPException(status_code=404, detail="Restaurant not found")
-        
         # Get tenant database
-        tenant_db, _ = TenantController.get_tenant_db_by_slug(slug, main_db)
-        db = tenant_db.get_session()
+        tenant_db, restaurant = await TenantController.get_tenant_db_by_slug(slug, main_db)
+        db = tenant_db.get_async_session()
         
         try:
             # Create new session
             session = ChatSession(id=uuid.uuid4())
             db.add(session)
-            db.commit()
+            await db.commit()
             
             return SessionResponse(
                 session_id=str(session.id),
                 restaurant={
-                    "id": str(restaurant.id),
-                    "slug": restaurant.slug,
-                    "name": restaurant.name,
-                    "description": f"Welcome to {restaurant.name}! I'm your AI assistant ready to help you order delicious food."
+                    "id": restaurant["id"],
+                    "slug": restaurant["slug"],
+                    "name": restaurant["name"],
+                    "description": f"Welcome to {restaurant['name']}! I'm your AI assistant ready to help you order delicious food."
                 }
             )
         finally:
-            db.close()
+            await db.close()
+
+    @staticmethod
+    async def _store_user_message(db: AsyncSession, restaurant: dict, message: ChatMessage) -> str:
+        """Get or create the chat session, enforce the rate limit and store the user's message"""
+        # Get or create session
+        if message.session_id:
+            result = await db.execute(
+                select(ChatSession).filter(ChatSession.id == message.session_id)
+            )
+            session = result.scalars().first()
+            if not session:
+                session = ChatSession(id=message.session_id)
+                db.add(session)
+        else:
+            session = ChatSession(id=uuid.uuid4())
+            db.add(session)
+        
+        # Check rate limit
+        session_id_str = str(session.id)
+        if not await check_rate_limit(db, session_id_str, restaurant["id"]):
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded. Please try again later."
+            )
+        
+        # Store user message
+        user_message = Message(
+            session_id=session.id,
+            sender=MessageSender.user,
+            content=message.content,
+            token_count=estimate_tokens(message.content)
+        )
+        db.add(user_message)
+        await db.commit()
+        restaurant_directory.record_activity(restaurant["id"])
+        
+        return session_id_str
 
     @staticmethod
-    async def chat_with_bot(slug: str, message: ChatMessage, main_db: Session) -> ChatResponse:
+    async def _store_bot_message(db: AsyncSession, restaurant: dict, session_id: str, bot_response: str, usage: dict):
+        """Store the bot's reply and the tokens the turn consumed"""
+        session_id_str, session_id = session_id, uuid.UUID(session_id)
+        
+        # Store bot response; its own size drives later context budgeting
+        bot_message = Message(
+            session_id=session_id,
+            sender=MessageSender.bot,
+            content=bot_response,
+            token_count=usage["reply_tokens"]
+        )
+        db.add(bot_message)
+        
+        await TenantController._store_token_usage(db, restaurant, session_id_str, usage["total_tokens"])
+
+    @staticmethod
+    async def _store_token_usage(db: AsyncSession, restaurant: dict, session_id: str, tokens: int):
+        """Store token usage as reported by the model (prompt and completion) and commit"""
+        if tokens:
+            token_usage = TokenUsage(
+                session_id=uuid.UUID(session_id),
+                tokens=tokens,
+                model=AI_MODEL
+            )
+            db.add(token_usage)
+        
+        await db.commit()
+        await record_token_usage(session_id, tokens, restaurant["id"])
+
+    @staticmethod
+    async def _store_abandoned_usage(tenant_db: TenantDatabase, restaurant: dict, session_id: str, tokens: int):
+        """Charge the tokens of a streamed turn that never reached its ``done`` event"""
+        db = tenant_db.get_async_session()
+        try:
+            await TenantController._store_token_usage(db, restaurant, session_id, tokens)
+        except Exception as e:
+            print(f"Failed to record usage of an interrupted stream: {str(e)}")
+        finally:
+            await db.close()
+
+    @staticmethod
+    async def chat_with_bot(slug: str, message: ChatMessage, main_db: AsyncSession) -> ChatResponse:
         """Handle chat with restaurant AI bot"""
         
-        tenant_db, restaurant = TenantController.get_tenant_db_by_slug(slug, main_db)
-        db = tenant_db.get_session()
+        tenant_db, restaurant = await TenantController.get_tenant_db_by_slug(slug, main_db)
+        db = tenant_db.get_async_session()
         try:
-            # Get or create session
-            if message.session_id:
-                session = db.query(ChatSession).filter(ChatSession.id == message.session_id).first()
-                if not session:
-                    session = ChatSession(id=message.session_id)
-                    db.add(session)
-            else:
-                session = ChatSession(id=uuid.uuid4())
-                db.add(session)
-            
-            # Check rate limit
-            session_id_str = str(session.id)
-            if not check_rate_limit(db, session_id_str):
-                raise HTTPException(
-                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                    detail="Rate limit exceeded. Please try again later."
-                )
-            
-            # Store user message
-            user_message = Message(
-                session_id=session.id,
-                sender=MessageSender.user,
-                content=message.content
-            )
-            db.add(user_message)
-            db.commit()
+            session_id_str = await TenantController._store_user_message(db, restaurant, message)
             
             # Get AI service
-            restaurant_info = {
-                "id": str(restaurant.id),
-                "slug": restaurant.slug,
-                "name": restaurant.name,
-                "gemini_api_key": restaurant.gemini_api_key,
-                "cloudinary_config": json.loads(restaurant.cloudinary_config) if restaurant.cloudinary_config else {}
-            }
-            ai_service = AIService(restaurant_info, tenant_db)
+            ai_service = get_ai_service(restaurant, tenant_db)
             
             # Process message with AI
-            bot_response, function_calls, token_count = await ai_service.process_message(
+            bot_response, function_calls, usage = await ai_service.process_message(
                 session_id_str, message.content
             )
             
-            # Store bot response
-            bot_message = Message(
-                session_id=session.id,
-                sender=MessageSender.bot,
-                content=bot_response,
-                token_count=token_count
-            )
-            db.add(bot_message)
-            
-            # Store token usage
-            from models.tenant_models import TokenUsage
-            token_usage = TokenUsage(
-                session_id=session.id,
-                tokens=token_count,
-                model="gemini-2.0-flash"
-            )
-            db.add(token_usage)
-            
-            db.commit()
+            await TenantController._store_bot_message(db, restaurant, session_id_str, bot_response, usage)
             
             return ChatResponse(
                 response=bot_response,
@@ -141,42 +180,89 @@ class TenantController:
                 function_calls=function_calls
             )
             
+        except HTTPException:
+            await db.rollback()
+            raise
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Chat processing failed: {str(e)}"
             )
         finally:
-            db.close()
+            await db.close()
 
     @staticmethod
-    def get_menu(slug: str, main_db: Session, search: Optional[str] = None):
-        """Get restaurant menu items"""
+    async def stream_chat_with_bot(slug: str, message: ChatMessage, main_db: AsyncSession) -> StreamingResponse:
+        """Handle chat with restaurant AI bot, streaming the reply as Server-Sent Events"""
         
-        tenant_db, _ = TenantController.get_tenant_db_by_slug(slug, main_db)
-        db = tenant_db.get_session()
+        tenant_db, restaurant = await TenantController.get_tenant_db_by_slug(slug, main_db)
+        db = tenant_db.get_async_session()
         try:
-            query = db.query(MenuItem).filter(MenuItem.available == True)
-            
-            if search:
-                query = query.filter(MenuItem.name.ilike(f"%{search}%"))
-            
-            menu_items = query.all()
-            
-            return [{
-                "id": str(item.id),
-                "name": item.name,
-                "description": item.description,
-                "price": float(item.price),
-                "available": item.available
-            } for item in menu_items]
-            
+            session_id_str = await TenantController._store_user_message(db, restaurant, message)
+        except HTTPException:
+            await db.rollback()
+            raise
+        except Exception as e:
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Chat processing failed: {str(e)}"
+            )
         finally:
-            db.close()
+            await db.close()
+        
+        ai_service = get_ai_service(restaurant, tenant_db)
+        
+        async def event_stream():
+            usage_so_far = {}
+            stored = False
+            yield _sse({"type": "session", "session_id": session_id_str})
+            try:
+                async for event in ai_service.stream_message(session_id_str, message.content, usage_so_far):
+                    if event["type"] == "done":
+                        # Persist the complete reply once the stream has finished
+                        stored = True
+                        db = tenant_db.get_async_session()
+                        try:
+                            await TenantController._store_bot_message(
+                                db, restaurant, session_id_str, event["response"], event["usage"]
+                            )
+                        finally:
+                            await db.close()
+                    yield _sse(event)
+            except Exception as e:
+                yield _sse({"type": "error", "detail": f"Chat processing failed: {str(e)}"})
+            finally:
+                # The client disconnected or the turn failed after tokens were spent:
+                # record them anyway, so closing the connection does not dodge the rate limit.
+                # Runs as its own task since this one may be getting cancelled.
+                if not stored and usage_so_far.get("total_tokens"):
+                    task = asyncio.create_task(TenantController._store_abandoned_usage(
+                        tenant_db, restaurant, session_id_str, usage_so_far["total_tokens"]
+                    ))
+                    _background_tasks.add(task)
+                    task.add_done_callback(_background_tasks.discard)
+        
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
 
     @staticmethod
-    async def upload_payment_proof(slug: str, file: UploadFile, main_db: Session):
+    async def get_menu(slug: str, request: Request, main_db: AsyncSession, search: Optional[str] = None):
+        """Get restaurant menu items, answering 304 when the client's copy is current"""
+        
+        tenant_db, restaurant = await TenantController.get_tenant_db_by_slug(slug, main_db)
+        snapshot = await menu_cache.get(restaurant["id"], tenant_db)
+        
+        if not search:
+            return cached_json_response(request, snapshot.body, snapshot.etag)
+        return cached_json_response(request, snapshot.public_body(search))
+
+    @staticmethod
+    async def upload_payment_proof(slug: str, file: UploadFile, main_db: AsyncSession):
         """Upload payment proof image"""
         
         if not file.content_type.startswith('image/'):
@@ -185,11 +271,23 @@ class TenantController:
                 detail="File must be an image"
             )
         
+        tenant_db, restaurant = await TenantController.get_tenant_db_by_slug(slug, main_db)
+        
         try:
-            # Upload to Cloudinary
-            image_url = await upload_image(file)
-            return {"image_url": image_url}
+            # Stream, shrink and store the image (re-uploads of the same image reuse the stored one)
+            upload = await upload_image(file, f"restaurant_payments/{restaurant['id']}", tenant_db)
+            return {"image_url": upload["url"], "content_hash": upload["content_hash"]}
             
+        except UploadTooLarge as e:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=str(e)
+            )
+        except InvalidImage as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -197,15 +295,29 @@ class TenantController:
             )
 
     @staticmethod
-    def get_session_messages(slug: str, session_id: str, main_db: Session, limit: int = 50):
-        """Get messages for a session"""
+    async def get_session_messages(slug: str, session_id: str, main_db: AsyncSession, limit: int = 50, before: Optional[str] = None):
+        """Get messages for a session, newest page first.
         
-        tenant_db, _ = TenantController.get_tenant_db_by_slug(slug, main_db)
-        db = tenant_db.get_session()
+        Returns the messages (oldest to newest) and a cursor for the next
+        older page, or None when there is nothing older.
+        """
+        
+        tenant_db, _ = await TenantController.get_tenant_db_by_slug(slug, main_db)
+        db = tenant_db.get_async_session()
         try:
-            messages = db.query(Message).filter(
-                Message.session_id == session_id
-            ).order_by(Message.created_at.desc()).limit(limit).all()
+            query = select(Message).filter(Message.session_id == session_id)
+            if before:
+                query = query.filter(keyset_filter(Message.created_at, Message.id, before))
+            
+            result = await db.execute(
+                query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1)
+            )
+            messages = result.scalars().all()
+            
+            next_cursor = None
+            if len(messages) > limit:
+                messages = messages[:limit]
+                next_cursor = encode_cursor(messages[-1].created_at, messages[-1].id)
             
             return [{
                 "id": str(msg.id),
@@ -213,7 +325,7 @@ class TenantController:
                 "content": msg.content,
                 "created_at": msg.created_at.isoformat(),
                 "token_count": msg.token_count
-            } for msg in reversed(messages)]
+            } for msg in reversed(messages)], next_cursor
             
         finally:
-            db.close()
\ No newline at end of file
+            await db.close()
\ No newline at end of file
@@ -1,10 +1,14 @@
-from .main_db import init_main_db, get_main_db, MainDatabase
-from .tenant_db import get_tenant_db, TenantDatabase
+from .main_db import init_main_db, close_main_db, get_main_db, get_main_async_db, MainDatabase
+from .tenant_db import get_tenant_db, invalidate_tenant_db, dispose_tenant_dbs, TenantDatabase
 
 __all__ = [
     'init_main_db',
+    'close_main_db',
     'get_main_db',
+    'get_main_async_db',
     'MainDatabase',
     'get_tenant_db',
+    'invalidate_tenant_db',
+    'dispose_tenant_dbs',
     'TenantDatabase'
 ]
\ No newline at end of file
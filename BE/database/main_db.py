@@ -1,12 +1,14 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, select, text
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 import os
 from dotenv import load_dotenv
-import bcrypt
 
 load_dotenv()
 
 from models.main_models import Base, SuperAdmin
+from database.urls import to_async_url, async_connect_args
+from utils.crypto import hash_secret
 
 # Main database connection
 MAIN_DB_URL = os.getenv("MAIN_DB_URL")
@@ -16,6 +18,15 @@ if not MAIN_DB_URL:
 main_engine = create_engine(MAIN_DB_URL, pool_size=10, max_overflow=20)
 MainSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=main_engine)
 
+# Async engine used by request handlers so queries don't block the event loop
+main_async_engine = create_async_engine(
+    to_async_url(MAIN_DB_URL), pool_size=10, max_overflow=20,
+    connect_args=async_connect_args(MAIN_DB_URL)
+)
+MainAsyncSessionLocal = async_sessionmaker(
+    bind=main_async_engine, autoflush=False, expire_on_commit=False
+)
+
 class MainDatabase:
     def __init__(self):
         self.session = MainSessionLocal()
@@ -30,32 +41,49 @@ class MainDatabase:
 
 async def init_main_db():
     """Initialize main database tables"""
-    Base.metadata.create_all(bind=main_engine)
+    async with main_async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        # create_all does not add columns to an existing restaurants table
+        await conn.execute(text("ALTER TABLE restaurants ADD COLUMN IF NOT EXISTS last_active_at TIMESTAMP"))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_restaurants_last_active_at ON restaurants (last_active_at)"))
     
     # Create super admin if not exists
     SUPER_ADMIN_USERNAME = os.getenv("SUPER_ADMIN_USERNAME", "msuhk")
     SUPER_ADMIN_PASSWORD = os.getenv("SUPER_ADMIN_PASSWORD", "Hello1234")
     
-    db = MainSessionLocal()
+    db = MainAsyncSessionLocal()
     try:
-        existing_admin = db.query(SuperAdmin).filter(
-            SuperAdmin.username == SUPER_ADMIN_USERNAME
-        ).first()
+        result = await db.execute(
+            select(SuperAdmin).filter(SuperAdmin.username == SUPER_ADMIN_USERNAME)
+        )
+        existing_admin = result.scalars().first()
         
         if not existing_admin:
-            password_hash = bcrypt.hashpw(SUPER_ADMIN_PASSWORD.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            password_hash = await hash_secret(SUPER_ADMIN_PASSWORD)
             super_admin = SuperAdmin(username=SUPER_ADMIN_USERNAME, password_hash=password_hash)
             db.add(super_admin)
-            db.commit()
+            await db.commit()
             print(f"Super admin created with username: {SUPER_ADMIN_USERNAME}")
     finally:
-        db.close()
+        await db.close()
     
     print("Main database initialized successfully")
 
+async def close_main_db():
+    """Release main database connections on shutdown"""
+    await main_async_engine.dispose()
+    main_engine.dispose()
+
 def get_main_db():
     db = MainSessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_main_async_db():
+    db = MainAsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
\ No newline at end of file
@@ -1,44 +1,421 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text, inspect, select
 from sqlalchemy.orm import sessionmaker
-from typing import Dict
+from sqlalchemy.pool import NullPool
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import os
+import threading
+import time
 
-from models.tenant_models import TenantBase
+from models.tenant_models import TenantBase, SchemaVersion
+from database.urls import to_async_url, async_connect_args
 
-# Connection cache
-tenant_engines: Dict[str, any] = {}
+# Per-tenant pool sizing and process-wide limits for the engine registry
+TENANT_POOL_SIZE = int(os.getenv("TENANT_POOL_SIZE", 5))
+TENANT_MAX_OVERFLOW = int(os.getenv("TENANT_MAX_OVERFLOW", 5))
+TENANT_MAX_ENGINES = int(os.getenv("TENANT_MAX_ENGINES", 50))
+TENANT_IDLE_TIMEOUT = int(os.getenv("TENANT_IDLE_TIMEOUT", 900))  # seconds
+TENANT_CONNECTION_BUDGET = int(os.getenv("TENANT_CONNECTION_BUDGET", 400))
+TENANT_PREWARM_CONCURRENCY = int(os.getenv("TENANT_PREWARM_CONCURRENCY", 8))
+
+# How tenant connections are pooled:
+#   dedicated - one pool per tenant db_url
+#   shared    - one pool per Postgres server/database; tenants are isolated by
+#               the ``schema`` query parameter on their db_url
+#   pgbouncer - no client-side pooling, prepared statements disabled
+TENANT_POOL_MODE = os.getenv("TENANT_POOL_MODE", "dedicated")
+TENANT_SCHEMA_PARAM = "schema"
+
+# Strong references to pool disposals in flight so they are not garbage-collected mid-run
+_disposal_tasks = set()
+# The server's event loop; async engines must be disposed on the loop their connections live on
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def _remember_loop():
+    """Record the running loop, if any, for disposals triggered from worker threads"""
+    global _loop
+    try:
+        _loop = asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+
+def _track_disposal(task):
+    _disposal_tasks.add(task)
+    task.add_done_callback(_disposal_tasks.discard)
+
+class ServerPool:
+    """Physical sync/async engines, possibly shared by several tenants"""
+
+    def __init__(self, engine, async_engine, connection_cost: int):
+        self.engine = engine
+        self.async_engine = async_engine
+        self.connection_cost = connection_cost  # Max connections both pools may open
+        self.tenants = 0
+
+    def dispose(self):
+        """Close pooled connections for both engines"""
+        self.engine.dispose()
+        try:
+            _track_disposal(asyncio.get_running_loop().create_task(self.async_engine.dispose()))
+        except RuntimeError:
+            # Called outside the event loop (e.g. from a worker thread)
+            if _loop is not None and not _loop.is_closed():
+                _track_disposal(asyncio.run_coroutine_threadsafe(self.async_engine.dispose(), _loop))
+            else:
+                # No loop ever ran these connections: drop the pool and let them close on GC
+                self.async_engine.sync_engine.dispose(close=False)
+
+    async def adispose(self):
+        """Close pooled connections, awaiting the async engine"""
+        self.engine.dispose()
+        await self.async_engine.dispose()
 
 class TenantDatabase:
-    def __init__(self, engine):
+    def __init__(self, engine, async_engine=None, schema: Optional[str] = None):
+        self.schema = schema
+        if schema:
+            # Route unqualified tenant tables into the tenant's schema on the shared pool
+            engine = engine.execution_options(schema_translate_map={None: schema})
+            if async_engine is not None:
+                async_engine = async_engine.execution_options(schema_translate_map={None: schema})
         self.engine = engine
+        self.async_engine = async_engine
         self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    
+        self.AsyncSessionLocal = async_sessionmaker(
+            bind=async_engine, autoflush=False, expire_on_commit=False
+        ) if async_engine is not None else None
+
     def get_session(self):
         return self.SessionLocal()
-    
-    def init_tables(self):
-        """Initialize tenant database tables"""
-        TenantBase.metadata.create_all(bind=self.engine)
 
-def get_tenant_db_from_url(db_url: str) -> TenantDatabase:
-    """Get or create tenant database connection from URL"""
-    cache_key = db_url
-    
-    if cache_key not in tenant_engines:
+    def get_async_session(self):
+        """Get an AsyncSession for use inside async request handlers"""
+        if self.AsyncSessionLocal is None:
+            raise RuntimeError("Tenant database has no async engine configured")
+        return self.AsyncSessionLocal()
+
+    def _applied_versions(self, conn) -> set:
+        if not inspect(conn).has_table(SchemaVersion.__tablename__, schema=self.schema):
+            return set()
+        return set(conn.execute(select(SchemaVersion.version)).scalars())
+
+    def get_schema_version(self) -> int:
+        """Highest applied tenant migration, 0 when untracked"""
+        with self.engine.connect() as conn:
+            return max(self._applied_versions(conn), default=0)
+
+    def init_tables(self) -> int:
+        """Bring the tenant schema up to what the models expect; returns the schema version.
+
+        Fresh databases get every table and index and are recorded at the
+        latest version. Older ones get their pending transactional migrations
+        (tables and columns the models query) applied here. Concurrent index
+        builds are only slower without, so they are left to
+        ``python -m database.tenant_migrations``. Workers opening the same
+        tenant at once are serialized by an advisory lock.
+        """
+        from database.tenant_migrations import MIGRATIONS, LATEST_SCHEMA_VERSION, TENANT_MIGRATION_LOCK_TIMEOUT, record_versions, run_steps_sync
+
+        with self.engine.connect() as conn:
+            applied = self._applied_versions(conn)
+        if not any(m.transactional and m.version not in applied for m in MIGRATIONS):
+            self._report_pending(applied, MIGRATIONS)
+            return max(applied, default=0)
+
+        if self.schema:
+            with self.engine.begin() as conn:
+                conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{self.schema}"'))
+
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": f"tenant_schema:{self.schema or ''}"})
+                conn.execute(text(f"SET LOCAL lock_timeout = '{TENANT_MIGRATION_LOCK_TIMEOUT}'"))
+                if self.schema:
+                    # Migration SQL names tables unqualified; schema_translate_map does not reach text()
+                    conn.execute(text(f'SET LOCAL search_path TO "{self.schema}"'))
+
+                if not inspect(conn).has_table("sessions", schema=self.schema):
+                    # Tables and indexes are created from the current models
+                    TenantBase.metadata.create_all(bind=conn)
+                    conn.execute(record_versions(MIGRATIONS))
+                    return LATEST_SCHEMA_VERSION
+
+                # Another worker may have upgraded the schema while we waited for the lock
+                applied = self._applied_versions(conn)
+                for migration in MIGRATIONS:
+                    if migration.transactional and migration.version not in applied:
+                        run_steps_sync(conn, migration)
+                        applied.add(migration.version)
+                        print(f"Applied tenant migration v{migration.version}: {migration.description}")
+        except Exception as e:
+            raise RuntimeError(f"Tenant schema could not be brought up to date; run python -m database.tenant_migrations: {str(e)}") from e
+
+        self._report_pending(applied, MIGRATIONS)
+        return max(applied, default=0)
+
+    @staticmethod
+    def _report_pending(applied: set, migrations):
+        pending = [m.version for m in migrations if m.version not in applied]
+        if pending:
+            print(f"Tenant schema is missing index migrations {pending}; run python -m database.tenant_migrations")
+
+def split_tenant_url(db_url: str) -> Tuple[str, Optional[str]]:
+    """Split a tenant db_url into its server URL and optional schema"""
+    url = make_url(db_url)
+    query = dict(url.query)
+    schema = query.pop(TENANT_SCHEMA_PARAM, None)
+    server_url = url.set(query=query).render_as_string(hide_password=False)
+    return server_url, schema
+
+def _create_server_pool(server_url: str, mode: str) -> ServerPool:
+    if mode == "pgbouncer":
+        # PgBouncer (transaction mode) owns the pooling and cannot keep
+        # prepared statements across transactions
         engine = create_engine(
-            db_url, 
-            pool_size=10, 
-            max_overflow=20,
-            pool_pre_ping=True,  # Verify connections before use
-            pool_recycle=3600,   # Recycle connections every hour
-            connect_args={"connect_timeout": 10}  # Connection timeout
+            server_url,
+            poolclass=NullPool,
+            connect_args={"connect_timeout": 10}
+        )
+        async_url = make_url(to_async_url(server_url)).update_query_dict(
+            {"prepared_statement_cache_size": "0"}
+        ).render_as_string(hide_password=False)
+        async_engine = create_async_engine(
+            async_url,
+            poolclass=NullPool,
+            connect_args=async_connect_args(server_url, timeout=10, statement_cache_size=0)
         )
-        tenant_db = TenantDatabase(engine)
-        tenant_db.init_tables()
-        tenant_engines[cache_key] = tenant_db
-        print(f"Created new tenant database connection for {cache_key}")
-    
-    return tenant_engines[cache_key]
+        return ServerPool(engine, async_engine, connection_cost=0)
+
+    engine = create_engine(
+        server_url,
+        pool_size=TENANT_POOL_SIZE,
+        max_overflow=TENANT_MAX_OVERFLOW,
+        pool_pre_ping=True,  # Verify connections before use
+        pool_recycle=3600,   # Recycle connections every hour
+        connect_args={"connect_timeout": 10}  # Connection timeout
+    )
+    async_engine = create_async_engine(
+        to_async_url(server_url),
+        pool_size=TENANT_POOL_SIZE,
+        max_overflow=TENANT_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        connect_args=async_connect_args(server_url, timeout=10)
+    )
+    return ServerPool(engine, async_engine, connection_cost=2 * (TENANT_POOL_SIZE + TENANT_MAX_OVERFLOW))
+
+class TenantEngineRegistry:
+    """LRU registry of tenant engines bounded by pool count, idle time and total connections"""
+
+    def __init__(self, max_engines: int, idle_timeout: int, connection_budget: int, mode: str = "dedicated"):
+        if mode not in ("dedicated", "shared", "pgbouncer"):
+            raise ValueError(f"Unknown tenant pool mode: {mode}")
+        self.max_engines = max_engines
+        self.idle_timeout = idle_timeout
+        self.connection_budget = connection_budget
+        self.mode = mode
+        self._entries: "OrderedDict[str, TenantDatabase]" = OrderedDict()
+        self._entry_pools: Dict[str, str] = {}
+        self._last_used: Dict[str, float] = {}
+        self._pools: Dict[str, ServerPool] = {}
+        self._reserved = 0
+        # Schema version seen per db_url; outlives LRU eviction so reconnecting skips init_tables
+        self._schema_versions: Dict[str, int] = {}
+        # One init_tables at a time per db_url; held across the (slow) schema check, unlike _lock
+        self._init_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.RLock()
+
+    def get(self, db_url: str) -> TenantDatabase:
+        """Return the cached tenant database, creating it if needed"""
+        with self._lock:
+            self._evict_idle()
+
+            tenant_db = self._entries.get(db_url)
+            if tenant_db is not None:
+                self._entries.move_to_end(db_url)
+                self._last_used[db_url] = time.monotonic()
+                ready = db_url in self._schema_versions
+            else:
+                tenant_db = self._create(db_url)
+                ready = False
+
+        if not ready:
+            self._ensure_schema(db_url, tenant_db)
+        return tenant_db
+
+    def _create(self, db_url: str) -> TenantDatabase:
+        """Register a new tenant database on its server pool (caller holds _lock)"""
+        if self.mode == "shared":
+            server_url, schema = split_tenant_url(db_url)
+        else:
+            server_url, schema = db_url, None
+
+        pool = self._pools.get(server_url)
+        if pool is None:
+            pool = _create_server_pool(server_url, self.mode)
+
+            # Make room under both the pool count and the connection budget
+            while self._entries and (
+                len(self._pools) >= self.max_engines
+                or self._reserved + pool.connection_cost > self.connection_budget
+            ):
+                oldest_url = next(iter(self._entries))
+                self._remove(oldest_url)
+
+            self._pools[server_url] = pool
+            self._reserved += pool.connection_cost
+
+        pool.tenants += 1
+        tenant_db = TenantDatabase(pool.engine, pool.async_engine, schema=schema)
+        self._entries[db_url] = tenant_db
+        self._entry_pools[db_url] = server_url
+        self._last_used[db_url] = time.monotonic()
+
+        print(f"Created new tenant database connection ({len(self._entries)} tenants, {len(self._pools)} pools, {self._reserved}/{self.connection_budget} connections reserved)")
+        return tenant_db
+
+    def _ensure_schema(self, db_url: str, tenant_db: TenantDatabase):
+        """Run init_tables once per db_url, making concurrent cold starts wait for the first"""
+        with self._lock:
+            if db_url in self._schema_versions:
+                return
+            init_lock = self._init_locks.setdefault(db_url, threading.Lock())
+
+        with init_lock:
+            with self._lock:
+                if db_url in self._schema_versions:
+                    return
+            try:
+                version = tenant_db.init_tables()
+            except Exception:
+                self.invalidate(db_url)
+                raise
+            with self._lock:
+                # Skip the marker if the tenant was invalidated meanwhile; it is checked again on reconnect
+                if self._entries.get(db_url) is tenant_db:
+                    self._schema_versions[db_url] = version
+                    self._init_locks.pop(db_url, None)
+
+    def get_ready(self, db_url: str) -> Optional[TenantDatabase]:
+        """Return the cached tenant database if its schema is already checked, without blocking I/O"""
+        with self._lock:
+            tenant_db = self._entries.get(db_url)
+            if tenant_db is None or db_url not in self._schema_versions:
+                return None
+            self._entries.move_to_end(db_url)
+            self._last_used[db_url] = time.monotonic()
+            return tenant_db
+
+    def invalidate(self, db_url: Optional[str]):
+        """Drop the engine for a tenant URL, disposing its pool once unused"""
+        if not db_url:
+            return
+        with self._lock:
+            self._schema_versions.pop(db_url, None)
+            if db_url in self._entries:
+                self._remove(db_url)
+
+    def drain(self) -> List[ServerPool]:
+        """Remove every cached tenant and pool without disposing them"""
+        with self._lock:
+            pools = list(self._pools.values())
+            self._entries.clear()
+            self._entry_pools.clear()
+            self._last_used.clear()
+            self._pools.clear()
+            self._reserved = 0
+        return pools
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "tenants": len(self._entries),
+                "pools": len(self._pools),
+                "max_engines": self.max_engines,
+                "connections_reserved": self._reserved,
+                "connection_budget": self.connection_budget
+            }
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        while self._entries:
+            oldest_url = next(iter(self._entries))
+            if self._last_used.get(oldest_url, 0) > cutoff:
+                break
+            self._remove(oldest_url)
+
+    def _remove(self, db_url: str):
+        self._entries.pop(db_url)
+        self._last_used.pop(db_url, None)
+        server_url = self._entry_pools.pop(db_url)
+
+        pool = self._pools[server_url]
+        pool.tenants -= 1
+        if pool.tenants <= 0:
+            del self._pools[server_url]
+            self._reserved -= pool.connection_cost
+            pool.dispose()
+
+# Connection cache
+tenant_registry = TenantEngineRegistry(
+    max_engines=TENANT_MAX_ENGINES,
+    idle_timeout=TENANT_IDLE_TIMEOUT,
+    connection_budget=TENANT_CONNECTION_BUDGET,
+    mode=TENANT_POOL_MODE
+)
+
+def get_tenant_db_from_url(db_url: str) -> TenantDatabase:
+    """Get or create tenant database connection from URL"""
+    _remember_loop()
+    return tenant_registry.get(db_url)
+
+async def aget_tenant_db_from_url(db_url: str) -> TenantDatabase:
+    """Get or create tenant database connection from URL inside async handlers.
+
+    Warm tenants come straight from the registry; creating an engine and
+    checking its schema are blocking, so they run in a worker thread.
+    """
+    _remember_loop()
+    tenant_db = tenant_registry.get_ready(db_url)
+    if tenant_db is not None:
+        return tenant_db
+    return await asyncio.to_thread(tenant_registry.get, db_url)
+
+def invalidate_tenant_db(db_url: Optional[str]):
+    """Dispose the cached engine for a tenant whose database changed or was removed"""
+    tenant_registry.invalidate(db_url)
+
+async def prewarm_tenant_dbs(db_urls: List[str], concurrency: int = TENANT_PREWARM_CONCURRENCY):
+    """Open pools for the given tenants in parallel so first requests find them warm"""
+    _remember_loop()
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def warm(db_url: str) -> bool:
+        async with semaphore:
+            try:
+                # Registry creation and the schema check are blocking; keep them off the loop
+                tenant_db = await asyncio.to_thread(tenant_registry.get, db_url)
+                async with tenant_db.async_engine.connect() as conn:
+                    await conn.execute(text("SELECT 1"))
+                return True
+            except Exception as e:
+                print(f"Failed to prewarm tenant database: {str(e)}")
+                return False
+
+    results = await asyncio.gather(*(warm(db_url) for db_url in dict.fromkeys(db_urls)))
+    print(f"Prewarmed {sum(results)}/{len(results)} tenant databases")
+
+async def dispose_tenant_dbs():
+    """Dispose all tenant engines on shutdown"""
+    for pool in tenant_registry.drain():
+        await pool.adispose()
+    # Let disposals started by evictions finish before the loop closes
+    if _disposal_tasks:
+        await asyncio.gather(*(asyncio.wrap_future(task) for task in list(_disposal_tasks)), return_exceptions=True)
 
 def get_tenant_db(restaurant_config) -> TenantDatabase:
     """Legacy function - use get_tenant_db_from_url instead"""
-    return get_tenant_db_from_url(restaurant_config['db_url'])
\ No newline at end of file
+    return get_tenant_db_from_url(restaurant_config['db_url'])
@@ -0,0 +1,266 @@
+"""Versioned schema migrations applied to every tenant database.
+
+``create_all`` only creates missing tables, so changes to existing tenant
+databases (new indexes, new columns) are recorded here as numbered
+migrations and tracked per tenant in a ``schema_version`` table.
+
+Run from the BE directory:
+
+    python -m database.tenant_migrations [--tenant SLUG ...] [--concurrency N] [--dry-run]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+from sqlalchemy import text, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+from sqlalchemy.pool import NullPool
+from dotenv import load_dotenv
+
+from models.tenant_models import TenantBase, SchemaVersion
+from database.urls import to_async_url, async_connect_args
+from database.tenant_db import split_tenant_url, TENANT_POOL_MODE
+
+load_dotenv()
+
+TENANT_MIGRATION_CONCURRENCY = int(os.getenv("TENANT_MIGRATION_CONCURRENCY", 8))
+# Plain DDL waits at most this long for a table lock instead of queueing live traffic behind it
+TENANT_MIGRATION_LOCK_TIMEOUT = os.getenv("TENANT_MIGRATION_LOCK_TIMEOUT", "5s")
+
+# SQL text, or a function of a sync Connection (run through run_sync on async connections)
+Step = Union[str, Callable[[Connection], None]]
+
+class Migration:
+    """A numbered tenant schema change.
+
+    Transactional migrations run in a single transaction together with their
+    schema_version row. Non-transactional ones run in autocommit mode (needed
+    for CREATE INDEX CONCURRENTLY) and must be safe to re-run after a failure.
+    """
+
+    def __init__(self, version: int, description: str, steps: Sequence[Step], transactional: bool = True):
+        self.version = version
+        self.description = description
+        self.steps = list(steps)
+        self.transactional = transactional
+
+def _model_index(table_name: str, index_name: str):
+    """Look up an index declared on a tenant model"""
+    table = TenantBase.metadata.tables[table_name]
+    for index in table.indexes:
+        if index.name == index_name:
+            return index
+    raise KeyError(f"{table_name} declares no index named {index_name}")
+
+def create_index_concurrently(table_name: str, index_name: str) -> Step:
+    """Build a model-declared index without blocking writes to the table"""
+    index = _model_index(table_name, index_name)
+    columns = ", ".join(f'"{column.name}"' for column in index.columns)
+
+    def step(conn: Connection):
+        # An interrupted concurrent build leaves an INVALID index behind, which
+        # IF NOT EXISTS would otherwise treat as done
+        result = conn.execute(
+            text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"),
+            {"name": index.name}
+        )
+        if result.scalar() is False:
+            conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{index.name}"'))
+        conn.execute(text(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{index.name}" ON "{table_name}" ({columns})'
+        ))
+
+    return step
+
+def _create_tables(conn: Connection):
+    TenantBase.metadata.create_all(bind=conn)
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Create tenant tables", [_create_tables]),
+    Migration(2, "Add chat history, rate limit, metrics and order item indexes", [
+        create_index_concurrently("messages", "ix_messages_session_id_created_at"),
+        create_index_concurrently("token_usage", "ix_token_usage_session_id_created_at"),
+        create_index_concurrently("orders", "ix_orders_status"),
+        create_index_concurrently("orders", "ix_orders_created_at_id"),
+        create_index_concurrently("order_items", "ix_order_items_order_id"),
+    ], transactional=False),
+    Migration(3, "Add rolling conversation summaries to sessions", [
+        "ALTER TABLE sessions ADD COLUMN IF NOT EXISTS context_summary TEXT",
+        "ALTER TABLE sessions ADD COLUMN IF NOT EXISTS summary_through TIMESTAMP",
+    ]),
+    Migration(4, "Record size, serving and deal pricing on order items", [
+        "ALTER TABLE order_items ADD COLUMN IF NOT EXISTS discount NUMERIC(10, 2) DEFAULT 0",
+        "ALTER TABLE order_items ADD COLUMN IF NOT EXISTS options TEXT",
+    ]),
+    Migration(5, "Add content-addressed uploads and payment proof hashes", [
+        _create_tables,
+        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS payment_proof_hash VARCHAR(64)",
+    ]),
+    Migration(6, "Index payment proof hashes", [
+        create_index_concurrently("orders", "ix_orders_payment_proof_hash"),
+    ], transactional=False),
+    Migration(7, "Index order update times for dashboard metrics", [
+        create_index_concurrently("orders", "ix_orders_updated_at"),
+    ], transactional=False),
+]
+
+LATEST_SCHEMA_VERSION = MIGRATIONS[-1].version
+
+def _create_migration_engine(db_url: str):
+    """Single-use engine for one tenant, outside the request-serving registry"""
+    if TENANT_POOL_MODE == "shared":
+        server_url, schema = split_tenant_url(db_url)
+    else:
+        server_url, schema = db_url, None
+
+    server_settings = {"lock_timeout": TENANT_MIGRATION_LOCK_TIMEOUT}
+    if schema:
+        server_settings["search_path"] = f'"{schema}"'
+
+    engine = create_async_engine(
+        to_async_url(server_url),
+        poolclass=NullPool,
+        connect_args=async_connect_args(server_url, timeout=10, server_settings=server_settings)
+    )
+    return engine, schema
+
+def record_versions(migrations: Sequence[Migration]):
+    """schema_version insert for the given migrations; a concurrent writer may record them first"""
+    return insert(SchemaVersion).values([
+        {"version": m.version, "description": m.description} for m in migrations
+    ]).on_conflict_do_nothing(index_elements=[SchemaVersion.version])
+
+async def _run_steps(conn: AsyncConnection, migration: Migration):
+    for step in migration.steps:
+        if isinstance(step, str):
+            await conn.execute(text(step))
+        else:
+            await conn.run_sync(step)
+    await conn.execute(record_versions([migration]))
+
+def run_steps_sync(conn: Connection, migration: Migration):
+    """Apply a transactional migration on a sync connection inside its transaction"""
+    for step in migration.steps:
+        if isinstance(step, str):
+            conn.execute(text(step))
+        else:
+            step(conn)
+    conn.execute(record_versions([migration]))
+
+async def get_applied_versions(conn: AsyncConnection) -> List[int]:
+    result = await conn.execute(select(SchemaVersion.version).order_by(SchemaVersion.version))
+    return [row[0] for row in result.all()]
+
+async def migrate_tenant(db_url: str, label: str = "tenant", dry_run: bool = False) -> List[int]:
+    """Apply pending migrations to one tenant database; returns the versions applied"""
+    engine, schema = _create_migration_engine(db_url)
+    applied_now = []
+    try:
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            if schema:
+                await conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema}"'))
+            await conn.run_sync(SchemaVersion.__table__.create, checkfirst=True)
+            applied = set(await get_applied_versions(conn))
+
+        pending = [m for m in MIGRATIONS if m.version not in applied]
+        if not pending:
+            print(f"[{label}] up to date (v{LATEST_SCHEMA_VERSION})")
+            return applied_now
+
+        for migration in pending:
+            if dry_run:
+                print(f"[{label}] pending v{migration.version}: {migration.description}")
+                continue
+
+            started = time.monotonic()
+            if migration.transactional:
+                async with engine.begin() as conn:
+                    await _run_steps(conn, migration)
+            else:
+                async with engine.connect() as conn:
+                    conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                    await _run_steps(conn, migration)
+            applied_now.append(migration.version)
+            print(f"[{label}] applied v{migration.version}: {migration.description} ({time.monotonic() - started:.1f}s)")
+    finally:
+        await engine.dispose()
+
+    return applied_now
+
+async def migrate_all_tenants(
+    tenants: Dict[str, str],
+    concurrency: int = TENANT_MIGRATION_CONCURRENCY,
+    dry_run: bool = False
+) -> Dict[str, Optional[str]]:
+    """Migrate many tenants concurrently.
+
+    ``tenants`` maps a label (the restaurant slug) to its db_url. Returns a
+    mapping of label to error message, None for tenants that succeeded.
+    """
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    total = len(tenants)
+    done = 0
+    results: Dict[str, Optional[str]] = {}
+
+    async def run(label: str, db_url: str):
+        nonlocal done
+        async with semaphore:
+            try:
+                await migrate_tenant(db_url, label, dry_run=dry_run)
+                results[label] = None
+            except Exception as e:
+                results[label] = str(e)
+                print(f"[{label}] migration failed: {str(e)}")
+            finally:
+                done += 1
+                print(f"Progress: {done}/{total} tenants")
+
+    await asyncio.gather(*(run(label, db_url) for label, db_url in tenants.items()))
+    return results
+
+async def load_tenants(slugs: Optional[Sequence[str]] = None) -> Dict[str, str]:
+    """Read tenant db_urls from the main database"""
+    from sqlalchemy import select
+    from database.main_db import MainAsyncSessionLocal
+    from models.main_models import Restaurant
+
+    db = MainAsyncSessionLocal()
+    try:
+        query = select(Restaurant.slug, Restaurant.db_url)
+        if slugs:
+            query = query.filter(Restaurant.slug.in_(slugs))
+        result = await db.execute(query)
+        return {slug: db_url for slug, db_url in result.all()}
+    finally:
+        await db.close()
+
+async def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations to tenant databases")
+    parser.add_argument("--tenant", action="append", dest="tenants", help="Restaurant slug (repeatable); default all")
+    parser.add_argument("--concurrency", type=int, default=TENANT_MIGRATION_CONCURRENCY)
+    parser.add_argument("--dry-run", action="store_true", help="List pending migrations without applying them")
+    args = parser.parse_args(argv)
+
+    from database.main_db import close_main_db
+    try:
+        tenants = await load_tenants(args.tenants)
+    finally:
+        await close_main_db()
+    print(f"Migrating {len(tenants)} tenant databases to v{LATEST_SCHEMA_VERSION} (concurrency {args.concurrency})")
+
+    results = await migrate_all_tenants(tenants, args.concurrency, args.dry_run)
+    failed = {label: error for label, error in results.items() if error}
+
+    print(f"\nDone: {len(results) - len(failed)} succeeded, {len(failed)} failed")
+    for label, error in failed.items():
+        print(f"  {label}: {error}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,68 @@
+import shlex
+from typing import Any, Dict
+from sqlalchemy.engine import make_url
+
+ASYNC_DRIVER = "postgresql+asyncpg"
+
+# libpq parameters asyncpg has no keyword for; passing them through fails every connect
+LIBPQ_ONLY_PARAMS = {"channel_binding", "gssencmode", "krbsrvname", "sslcompression", "requirepeer"}
+# libpq parameters asyncpg takes in another shape; see async_connect_args
+TRANSLATED_PARAMS = {"connect_timeout", "options", "application_name"}
+
+def to_async_url(db_url: str) -> str:
+    """Convert a sync PostgreSQL URL into its asyncpg equivalent.
+
+    Parameters asyncpg does not accept in the URL are dropped here; pass
+    ``async_connect_args(db_url)`` as ``connect_args`` to keep their effect.
+    """
+    url = make_url(db_url)
+    query = {
+        key: value for key, value in url.query.items()
+        if key not in LIBPQ_ONLY_PARAMS and key not in TRANSLATED_PARAMS
+    }
+
+    # asyncpg understands ``ssl`` rather than libpq's ``sslmode``
+    if "sslmode" in query:
+        query["ssl"] = query.pop("sslmode")
+
+    return url.set(drivername=ASYNC_DRIVER, query=query).render_as_string(hide_password=False)
+
+def _last(value) -> str:
+    # make_url gives a tuple when a parameter is repeated; libpq uses the last one
+    return value[-1] if isinstance(value, tuple) else value
+
+def async_connect_args(db_url: str, **defaults: Any) -> Dict[str, Any]:
+    """asyncpg connect arguments for the libpq parameters ``to_async_url`` drops.
+
+    ``connect_timeout`` becomes ``timeout``, and ``options`` (``-c name=value``)
+    and ``application_name`` become ``server_settings``. Values from the URL
+    win over ``defaults``.
+    """
+    query = make_url(db_url).query
+    connect_args = dict(defaults)
+    server_settings = dict(connect_args.pop("server_settings", None) or {})
+
+    if "connect_timeout" in query:
+        connect_args["timeout"] = float(_last(query["connect_timeout"]))
+
+    if "application_name" in query:
+        server_settings["application_name"] = _last(query["application_name"])
+
+    if "options" in query:
+        words = shlex.split(_last(query["options"]))
+        for index, word in enumerate(words):
+            if word == "-c" and index + 1 < len(words):
+                setting = words[index + 1]
+            elif word.startswith("-c") and len(word) > 2:
+                setting = word[2:]
+            elif word.startswith("--"):
+                setting = word[2:]
+            else:
+                continue
+            if "=" in setting:
+                name, value = setting.split("=", 1)
+                server_settings[name.replace("-", "_")] = value
+
+    if server_settings:
+        connect_args["server_settings"] = server_settings
+    return connect_args
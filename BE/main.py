@@ -1,18 +1,38 @@
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 import uvicorn
+import os
 
-from database import init_main_db
+from database import init_main_db, close_main_db, dispose_tenant_dbs
 from routers import auth, tenant, admin, super_admin
 from middleware.rate_limit import RateLimitMiddleware
+from middleware.compression import CompressionMiddleware
+from middleware.upload_limit import UploadLimitMiddleware
+from services.cache_bus import start_cache_bus, stop_cache_bus
+from services.restaurant_directory import prewarm_tenants
+from utils.redis_client import close_redis
+from utils.crypto import crypto_executor
+from utils.email import start_email_outbox, stop_email_outbox
+from services.image_service import UPLOAD_STORAGE, UPLOAD_LOCAL_DIR, UPLOAD_LOCAL_BASE_URL
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Initialize main database
     await init_main_db()
+    await start_cache_bus()
+    await start_email_outbox()
+    # Open pools for busy tenants so the first requests after a deploy are warm
+    await prewarm_tenants()
     yield
-    # Cleanup if needed
+    await stop_email_outbox()
+    await stop_cache_bus()
+    await close_redis()
+    crypto_executor.shutdown()
+    # Release pooled connections
+    await dispose_tenant_dbs()
+    await close_main_db()
 
 app = FastAPI(
     title="Multi-Tenant Restaurant Ordering System",
@@ -21,6 +41,9 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Refuse oversized uploads before multipart parsing spools them (inside CORS so the 413 is readable)
+app.add_middleware(UploadLimitMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -28,10 +51,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Browsers hide non-safelisted response headers from cross-origin JS otherwise
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # Custom middlewares
 app.add_middleware(RateLimitMiddleware)
+app.add_middleware(CompressionMiddleware, minimum_size=1000)
 
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["authentication"])
@@ -39,6 +65,11 @@ app.include_router(super_admin.router, prefix="/api/super-admin", tags=["super-a
 app.include_router(tenant.router, prefix="/api/tenant", tags=["tenant"])
 app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
 
+# Serve images stored by the local upload backend
+if UPLOAD_STORAGE == "local":
+    os.makedirs(UPLOAD_LOCAL_DIR, exist_ok=True)
+    app.mount(UPLOAD_LOCAL_BASE_URL, StaticFiles(directory=UPLOAD_LOCAL_DIR), name="uploads")
+
 @app.get("/")
 async def root():
     return {"message": "Multi-Tenant Restaurant Ordering System API"}
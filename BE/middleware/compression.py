@@ -0,0 +1,36 @@
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # Optional: fall back to gzip only
+    BrotliMiddleware = None
+
+class CompressionMiddleware:
+    """Compress large responses (brotli when available, else gzip).
+
+    Server-Sent Event streams are passed through untouched: the compressors
+    buffer output, which would hold back streamed tokens.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1000):
+        self.app = app
+        if BrotliMiddleware is not None:
+            self.compressed_app = BrotliMiddleware(app, minimum_size=minimum_size, gzip_fallback=True)
+        else:
+            self.compressed_app = GZipMiddleware(app, minimum_size=minimum_size)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or self._is_event_stream(scope):
+            await self.app(scope, receive, send)
+            return
+        await self.compressed_app(scope, receive, send)
+
+    @staticmethod
+    def _is_event_stream(scope: Scope) -> bool:
+        if scope["path"].endswith("/stream"):
+            return True
+        for name, value in scope.get("headers", []):
+            if name == b"accept" and b"text/event-stream" in value:
+                return True
+        return False
@@ -0,0 +1,72 @@
+from fastapi import HTTPException, status
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from services.image_service import UPLOAD_MAX_BYTES
+
+# Room for multipart boundaries, part headers and small form fields around the file
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+class UploadLimitMiddleware:
+    """Refuse multipart bodies over the upload cap before they are parsed.
+
+    Starlette spools the whole multipart body into the UploadFile before the
+    handler runs, so size checks in the handler come too late. Requests
+    declaring a larger Content-Length get a 413 without being read; bodies
+    without one (chunked) are counted as they arrive and cut off at the cap.
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int = UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self._is_multipart(scope):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = self._content_length(scope)
+        if content_length is not None and content_length > self.max_bytes:
+            response = JSONResponse(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                content={"detail": self._too_large_detail()}
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised inside form parsing; FastAPI passes HTTPExceptions through as the response
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=self._too_large_detail()
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    def _too_large_detail(self) -> str:
+        return f"Image is larger than {UPLOAD_MAX_BYTES // (1024 * 1024)} MB"
+
+    @staticmethod
+    def _is_multipart(scope: Scope) -> bool:
+        for name, value in scope.get("headers", []):
+            if name == b"content-type" and value.lower().startswith(b"multipart/form-data"):
+                return True
+        return False
+
+    @staticmethod
+    def _content_length(scope: Scope):
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    return int(value)
+                except ValueError:
+                    return None
+        return None
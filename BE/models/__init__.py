@@ -1,7 +1,7 @@
 from .main_models import Restaurant, AdminOTP, SuperAdmin
 from .tenant_models import (
     Settings, Session, Message, TokenUsage, Menu, MenuItem, 
-    Order, OrderItem, OrderStatus, PaymentStatus, MessageSender
+    Order, OrderItem, OrderStatus, PaymentStatus, MessageSender, Upload
 )
 
 __all__ = [
@@ -18,5 +18,6 @@ __all__ = [
     'OrderItem',
     'OrderStatus',
     'PaymentStatus',
-    'MessageSender'
+    'MessageSender',
+    'Upload'
 ]
\ No newline at end of file
@@ -31,8 +31,10 @@ class Restaurant(Base):
     cloudinary_config = Column(Text)  # JSON config for Cloudinary
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    last_active_at = Column(DateTime, index=True)  # Latest chat traffic, written at most every few minutes
 
 class AdminOTP(Base):
+    """Legacy bcrypt OTP rows; codes now live in utils.otp_store and nothing writes here"""
     __tablename__ = "admin_otp"
     
     id = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
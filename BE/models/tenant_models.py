@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Text, DateTime, Boolean, UUID, DECIMAL, Enum
+from sqlalchemy import Column, String, Integer, Text, DateTime, Boolean, UUID, DECIMAL, Enum, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID
@@ -29,6 +29,13 @@ class MessageSender(enum.Enum):
     bot = "bot"
 
 # Tenant Models
+class SchemaVersion(TenantBase):
+    __tablename__ = "schema_version"
+    
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    description = Column(Text, nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
 class Settings(TenantBase):
     __tablename__ = "settings"
     
@@ -46,11 +53,16 @@ class Session(TenantBase):
     customer_email = Column(String(255))
     delivery_address = Column(Text)
     notes = Column(Text)
+    context_summary = Column(Text)  # Rolling summary of turns no longer sent verbatim
+    summary_through = Column(DateTime)  # created_at of the newest message folded into the summary
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Message(TenantBase):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_session_id_created_at", "session_id", "created_at"),
+    )
     
     id = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     session_id = Column(PG_UUID(as_uuid=True), ForeignKey('sessions.id', ondelete='CASCADE'), nullable=False)
@@ -61,6 +73,9 @@ class Message(TenantBase):
 
 class TokenUsage(TenantBase):
     __tablename__ = "token_usage"
+    __table_args__ = (
+        Index("ix_token_usage_session_id_created_at", "session_id", "created_at"),
+    )
     
     id = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     session_id = Column(PG_UUID(as_uuid=True), ForeignKey('sessions.id', ondelete='CASCADE'), nullable=False)
@@ -127,6 +142,12 @@ class MenuItem(TenantBase):
 
 class Order(TenantBase):
     __tablename__ = "orders"
+    __table_args__ = (
+        Index("ix_orders_status", "status"),
+        Index("ix_orders_created_at_id", "created_at", "id"),  # Also serves keyset pagination
+        Index("ix_orders_payment_proof_hash", "payment_proof_hash"),
+        Index("ix_orders_updated_at", "updated_at"),  # Delivered-in-window metric
+    )
     
     id = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     session_id = Column(PG_UUID(as_uuid=True), ForeignKey('sessions.id', ondelete='RESTRICT'), nullable=False)
@@ -135,14 +156,48 @@ class Order(TenantBase):
     total_price = Column(DECIMAL(10, 2), nullable=False, default=0)
     payment_proof_text = Column(Text)
     payment_proof_image_url = Column(Text)
+    payment_proof_hash = Column(String(64))  # SHA-256 of the stored proof image, see Upload
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    session = relationship("Session")
+    items = relationship("OrderItem", back_populates="order")
 
 class OrderItem(TenantBase):
     __tablename__ = "order_items"
+    __table_args__ = (
+        Index("ix_order_items_order_id", "order_id"),
+    )
     
     id = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     order_id = Column(PG_UUID(as_uuid=True), ForeignKey('orders.id', ondelete='CASCADE'), nullable=False)
     menu_item_id = Column(PG_UUID(as_uuid=True), ForeignKey('menu_items.id'), nullable=False)
     quantity = Column(Integer, nullable=False)
-    unit_price = Column(DECIMAL(10, 2), nullable=False)
\ No newline at end of file
+    unit_price = Column(DECIMAL(10, 2), nullable=False)
+    discount = Column(DECIMAL(10, 2), default=0)  # Deal discount for the whole line
+    options = Column(Text)  # JSON object: size, serving and deal the line was priced with
+    
+    order = relationship("Order", back_populates="items")
+    menu_item = relationship("MenuItem")
+    
+    def get_options(self):
+        """Parse options JSON"""
+        if self.options:
+            try:
+                return json.loads(self.options)
+            except:
+                return {}
+        return {}
+
+class Upload(TenantBase):
+    """A stored image, addressed by the SHA-256 of its normalized bytes"""
+    __tablename__ = "uploads"
+    __table_args__ = (
+        Index("ix_uploads_url", "url"),
+    )
+    
+    id = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    content_hash = Column(String(64), nullable=False, unique=True)
+    url = Column(Text, nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
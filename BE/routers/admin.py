@@ -1,10 +1,10 @@
 from fastapi import APIRouter, Depends, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from datetime import datetime
 
-from database.main_db import get_main_db
+from database.main_db import get_main_async_db
 from controllers.admin_controller import AdminController
 from schemas.admin_schemas import OrderUpdate, SessionUpdate, MenuItemCreate, MenuItemUpdate, MenuCreate, MenuUpdate
 
@@ -22,103 +22,105 @@ async def get_orders(
     search: Optional[str] = None,
     date_from: Optional[datetime] = None,
     date_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    count: str = Query("exact", pattern="^(exact|estimate|none)$"),
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    main_db: Session = Depends(get_main_db)
+    main_db: AsyncSession = Depends(get_main_async_db)
 ):
     """Get orders with filtering and pagination"""
-    return AdminController.get_orders(
+    return await AdminController.get_orders(
         credentials.credentials, main_db, page, limit, status, payment_status,
-        sort_by, sort_order, search, date_from, date_to
+        sort_by, sort_order, search, date_from, date_to, cursor, count
     )
 
 @router.get("/orders/{order_id}")
 async def get_order_detail(
     order_id: str,
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    main_db: Session = Depends(get_main_db)
+    main_db: AsyncSession = Depends(get_main_async_db)
 ):
     """Get detailed order information"""
-    return AdminController.get_order_detail(credentials.credentials, main_db, order_id)
+    return await AdminController.get_order_detail(credentials.credentials, main_db, order_id)
 
 @router.put("/orders/{order_id}")
 async def update_order(
     order_id: str,
     update_data: OrderUpdate,
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    main_db: Session = Depends(get_main_db)
+    main_db: AsyncSession = Depends(get_main_async_db)
 ):
     """Update order status or payment status"""
-    return AdminController.update_order(credentials.credentials, main_db, order_id, update_data)
+    return await AdminController.update_order(credentials.credentials, main_db, order_id, update_data)
 
 @router.get("/metrics/24h")
 async def get_24h_metrics(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    main_db: Session = Depends(get_main_db)
+    main_db: AsyncSession = Depends(get_main_async_db)
 ):
     """Get 24-hour rolling metrics"""
-    return AdminController.get_24h_metrics(credentials.credentials, main_db)
+    return await AdminController.get_24h_metrics(credentials.credentials, main_db)
 
 @router.put("/sessions/{session_id}")
 async def update_session(
     session_id: str,
     update_data: SessionUpdate,
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    main_db: Session = Depends(get_main_db)
+    main_db: AsyncSession = Depends(get_main_async_db)
 ):
     """Update session/customer details"""
-    return AdminController.update_session(credentials.credentials, main_db, session_id, update_data)
+    return await AdminController.update_session(credentials.credentials, main_db, session_id, update_data)
 
 @router.get("/menus")
 async def get_menus(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    main_db: Session = Depends(get_main_db)
+    main_db: AsyncSession = Depends(get_main_async_db)
 ):
     """Get all menus"""
-    return AdminController.get_menus(credentials.credentials, main_db)
+    return await AdminController.get_menus(credentials.credentials, main_db)
 
 @router.post("/menus")
 async def create_menu(
     menu_data: MenuCreate,
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    main_db: Session = Depends(get_main_db)
+    main_db: AsyncSession = Depends(get_main_async_db)
 ):
     """Create a new menu"""
-    return AdminController.create_menu(credentials.credentials, main_db, menu_data)
+    return await AdminController.create_menu(credentials.credentials, main_db, menu_data)
 
 @router.get("/menu-items")
 async def get_menu_items(
     menu_id: Optional[str] = None,
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    main_db: Session = Depends(get_main_db)
+    main_db: AsyncSession = Depends(get_main_async_db)
 ):
     """Get menu items"""
-    return AdminController.get_menu_items(credentials.credentials, main_db, menu_id)
+    return await AdminController.get_menu_items(credentials.credentials, main_db, menu_id)
 
 @router.post("/menus/{menu_id}/items")
 async def create_menu_item(
     menu_id: str,
     item_data: MenuItemCreate,
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    main_db: Session = Depends(get_main_db)
+    main_db: AsyncSession = Depends(get_main_async_db)
 ):
     """Create a new menu item"""
-    return AdminController.create_menu_item(credentials.credentials, main_db, menu_id, item_data)
+    return await AdminController.create_menu_item(credentials.credentials, main_db, menu_id, item_data)
 
 @router.put("/menu-items/{item_id}")
 async def update_menu_item(
     item_id: str,
     item_data: MenuItemUpdate,
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    main_db: Session = Depends(get_main_db)
+    main_db: AsyncSession = Depends(get_main_async_db)
 ):
     """Update a menu item"""
-    return AdminController.update_menu_item(credentials.credentials, main_db, item_id, item_data)
+    return await AdminController.update_menu_item(credentials.credentials, main_db, item_id, item_data)
 
 @router.delete("/menu-items/{item_id}")
 async def delete_menu_item(
     item_id: str,
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    main_db: Session = Depends(get_main_db)
+    main_db: AsyncSession = Depends(get_main_async_db)
 ):
     """Delete a menu item"""
-    return AdminController.delete_menu_item(credentials.credentials, main_db, item_id)
\ No newline at end of file
+    return await AdminController.delete_menu_item(credentials.credentials, main_db, item_id)
\ No newline at end of file
@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.main_db import get_main_db
+from database.main_db import get_main_async_db
 from controllers.auth_controller import AuthController
 from schemas.auth_schemas import LoginRequest, OTPVerifyRequest, TokenResponse, SuperAdminLoginRequest
 from utils.auth import create_access_token, verify_token
@@ -11,17 +11,17 @@ router = APIRouter()
 security = HTTPBearer()
 
 @router.post("/login")
-async def restaurant_login(request: LoginRequest, db: Session = Depends(get_main_db)):
+async def restaurant_login(request: LoginRequest, db: AsyncSession = Depends(get_main_async_db)):
     """Step 1: Validate credentials and send OTP"""
     return await AuthController.restaurant_login(request, db)
 
 @router.post("/verify-otp", response_model=TokenResponse)
-async def verify_restaurant_otp(request: OTPVerifyRequest, db: Session = Depends(get_main_db)):
+async def verify_restaurant_otp(request: OTPVerifyRequest, db: AsyncSession = Depends(get_main_async_db)):
     """Step 2: Verify OTP and issue JWT token"""
     return await AuthController.verify_restaurant_otp(request, db)
 
 @router.post("/super-admin/login", response_model=TokenResponse)
-async def super_admin_login(request: SuperAdminLoginRequest, db: Session = Depends(get_main_db)):
+async def super_admin_login(request: SuperAdminLoginRequest, db: AsyncSession = Depends(get_main_async_db)):
     """Super admin login"""
     return await AuthController.super_admin_login(request, db)
 
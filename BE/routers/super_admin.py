@@ -28,7 +28,7 @@ async def create_restaurant(
     current_admin = Depends(verify_super_admin)
 ):
     """Create a new restaurant"""
-    return SuperAdminController.create_restaurant(restaurant_data, db)
+    return await SuperAdminController.create_restaurant(restaurant_data, db)
 
 @router.get("/restaurants", response_model=RestaurantListResponse)
 async def get_restaurants(
@@ -67,4 +67,14 @@ async def delete_restaurant(
     current_admin = Depends(verify_super_admin)
 ):
     """Delete restaurant"""
-    return SuperAdminController.delete_restaurant(restaurant_id, db)
\ No newline at end of file
+    return SuperAdminController.delete_restaurant(restaurant_id, db)
+
+@router.get("/intent-router/stats")
+async def get_intent_router_stats(current_admin = Depends(verify_super_admin)):
+    """Chat fast-path hit rate and latency savings"""
+    return SuperAdminController.get_intent_router_stats()
+
+@router.get("/crypto/stats")
+async def get_crypto_stats(current_admin = Depends(verify_super_admin)):
+    """Password and OTP hashing pool load"""
+    return SuperAdminController.get_crypto_stats()
@@ -1,49 +1,59 @@
-from fastapi import APIRouter, Depends, UploadFile, File
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, UploadFile, File, Response, Request, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 
-from database.main_db import get_main_db
+from database.main_db import get_main_async_db
 from controllers.tenant_controller import TenantController
 from schemas.tenant_schemas import ChatMessage, ChatResponse, SessionResponse
 
 router = APIRouter()
 
 @router.get("/restaurants")
-async def list_restaurants(main_db: Session = Depends(get_main_db)):
+async def list_restaurants(request: Request, main_db: AsyncSession = Depends(get_main_async_db)):
     """Get list of all restaurants"""
-    return TenantController.list_restaurants(main_db)
+    return await TenantController.list_restaurants(request, main_db)
 
 @router.post("/{slug}/session", response_model=SessionResponse)
 async def create_session(
     slug: str,
-    main_db: Session = Depends(get_main_db)
+    main_db: AsyncSession = Depends(get_main_async_db)
 ):
     """Create a new chat session for a restaurant"""
-    return TenantController.create_session(slug, main_db)
+    return await TenantController.create_session(slug, main_db)
 
 @router.post("/{slug}/chat", response_model=ChatResponse)
 async def chat_with_bot(
     slug: str,
     message: ChatMessage,
-    main_db: Session = Depends(get_main_db)
+    main_db: AsyncSession = Depends(get_main_async_db)
 ):
     """Handle chat with restaurant AI bot"""
     return await TenantController.chat_with_bot(slug, message, main_db)
 
+@router.post("/{slug}/chat/stream")
+async def stream_chat_with_bot(
+    slug: str,
+    message: ChatMessage,
+    main_db: AsyncSession = Depends(get_main_async_db)
+):
+    """Handle chat with restaurant AI bot, streaming tokens over Server-Sent Events"""
+    return await TenantController.stream_chat_with_bot(slug, message, main_db)
+
 @router.get("/{slug}/menu")
 async def get_menu(
     slug: str,
+    request: Request,
     search: Optional[str] = None,
-    main_db: Session = Depends(get_main_db)
+    main_db: AsyncSession = Depends(get_main_async_db)
 ):
     """Get restaurant menu items"""
-    return TenantController.get_menu(slug, main_db, search)
+    return await TenantController.get_menu(slug, request, main_db, search)
 
 @router.post("/{slug}/upload-payment-proof")
 async def upload_payment_proof(
     slug: str,
     file: UploadFile = File(...),
-    main_db: Session = Depends(get_main_db)
+    main_db: AsyncSession = Depends(get_main_async_db)
 ):
     """Upload payment proof image"""
     return await TenantController.upload_payment_proof(slug, file, main_db)
@@ -52,8 +62,13 @@ async def upload_payment_proof(
 async def get_session_messages(
     slug: str,
     session_id: str,
-    limit: int = 50,
-    main_db: Session = Depends(get_main_db)
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = None,
+    main_db: AsyncSession = Depends(get_main_async_db)
 ):
-    """Get messages for a session"""
-    return TenantController.get_session_messages(slug, session_id, main_db, limit)
\ No newline at end of file
+    """Get messages for a session; X-Next-Cursor holds the cursor for older messages"""
+    messages, next_cursor = await TenantController.get_session_messages(slug, session_id, main_db, limit, before)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return messages
\ No newline at end of file
@@ -0,0 +1,85 @@
+import asyncio
+import json
+import os
+import uuid
+from typing import Callable, Dict, List, Optional
+from dotenv import load_dotenv
+
+from utils.redis_client import get_redis
+
+load_dotenv()
+
+# Optional Redis pub/sub used to fan cache invalidations out to every worker
+CACHE_BUS_CHANNEL = os.getenv("CACHE_BUS_CHANNEL", "restaurant-bot:invalidate")
+
+WORKER_ID = uuid.uuid4().hex
+
+_handlers: Dict[str, List[Callable[[str], None]]] = {}
+_redis = None
+_listener_task: Optional[asyncio.Task] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def register_handler(kind: str, handler: Callable[[str], None]):
+    """Register a local invalidation callback for a cache kind"""
+    _handlers.setdefault(kind, []).append(handler)
+
+def publish_invalidation(kind: str, key: str):
+    """Tell other workers to drop ``key`` from their ``kind`` cache"""
+    if _redis is None:
+        return
+
+    payload = json.dumps({"kind": kind, "key": key, "origin": WORKER_ID})
+    try:
+        asyncio.get_running_loop().create_task(_publish(payload))
+    except RuntimeError:
+        # Called outside the event loop (e.g. from a worker thread)
+        if _loop is not None:
+            asyncio.run_coroutine_threadsafe(_publish(payload), _loop)
+
+async def _publish(payload: str):
+    try:
+        await _redis.publish(CACHE_BUS_CHANNEL, payload)
+    except Exception as e:
+        print(f"Failed to publish cache invalidation: {str(e)}")
+
+async def _listen():
+    pubsub = _redis.pubsub()
+    await pubsub.subscribe(CACHE_BUS_CHANNEL)
+    try:
+        async for message in pubsub.listen():
+            if message.get("type") != "message":
+                continue
+            try:
+                data = json.loads(message["data"])
+            except (TypeError, ValueError):
+                continue
+            if data.get("origin") == WORKER_ID:
+                continue
+
+            for handler in _handlers.get(data.get("kind"), []):
+                handler(data.get("key"))
+    finally:
+        await pubsub.close()
+
+async def start_cache_bus():
+    """Connect to Redis and start listening for invalidations"""
+    global _redis, _listener_task, _loop
+    _redis = get_redis()
+    if _redis is None:
+        return
+
+    _loop = asyncio.get_running_loop()
+    _listener_task = asyncio.create_task(_listen())
+    print("Cache invalidation bus connected")
+
+async def stop_cache_bus():
+    """Stop the listener"""
+    global _redis, _listener_task
+    if _listener_task is not None:
+        _listener_task.cancel()
+        try:
+            await _listener_task
+        except asyncio.CancelledError:
+            pass
+        _listener_task = None
+    _redis = None
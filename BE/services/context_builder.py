@@ -0,0 +1,83 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from models.tenant_models import Message
+
+# Prompt tokens allowed for conversation history (summary included)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 2000))
+# Once over budget, history is trimmed to this share of it so summaries run in batches, not every turn
+CONTEXT_TRIM_RATIO = float(os.getenv("CONTEXT_TRIM_RATIO", 0.5))
+# Most recent rows considered per turn
+CONTEXT_MAX_MESSAGES = int(os.getenv("CONTEXT_MAX_MESSAGES", 40))
+CONTEXT_SUMMARY_MAX_WORDS = int(os.getenv("CONTEXT_SUMMARY_MAX_WORDS", 150))
+
+# Fallback when a message has no recorded count (roughly 4 characters per token)
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+def message_tokens(message: Message) -> int:
+    """Recorded token count of a stored message, estimated when missing"""
+    return message.token_count or estimate_tokens(message.content)
+
+def fit_history(history: List[Message], budget: int) -> Tuple[List[Message], List[Message]]:
+    """Split oldest-first history into (kept, overflow).
+
+    Everything is kept while it fits the budget. Past it, only the newest
+    messages fitting ``budget * CONTEXT_TRIM_RATIO`` are kept and the older
+    ones overflow into the rolling summary.
+    """
+    sizes = [message_tokens(message) for message in history]
+    if sum(sizes) <= budget:
+        return history, []
+
+    target = max(int(budget * CONTEXT_TRIM_RATIO), 0)
+    used, start = 0, len(history)
+    while start > 0 and used + sizes[start - 1] <= target:
+        start -= 1
+        used += sizes[start]
+    return history[start:], history[:start]
+
+def empty_usage() -> Dict[str, int]:
+    return {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+
+def response_usage(response: Any) -> Optional[Dict[str, int]]:
+    """Token usage Gemini reported for one model response, if any"""
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        usage = (getattr(response, "response_metadata", None) or {}).get("usage_metadata")
+    if not usage:
+        return None
+    input_tokens = int(usage.get("input_tokens", usage.get("prompt_token_count", 0)) or 0)
+    output_tokens = int(usage.get("output_tokens", usage.get("candidates_token_count", 0)) or 0)
+    total_tokens = int(usage.get("total_tokens", usage.get("total_token_count", 0)) or 0)
+    return {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": total_tokens or input_tokens + output_tokens
+    }
+
+def add_usage(total: Dict[str, int], usage: Optional[Dict[str, int]]):
+    if usage:
+        for key in ("input_tokens", "output_tokens", "total_tokens"):
+            total[key] += usage.get(key, 0)
+
+def summary_prompt(previous_summary: Optional[str], messages: List[Message]) -> List[BaseMessage]:
+    """Prompt folding older turns into the running session summary"""
+    transcript = "\n".join(
+        f"{'Customer' if message.sender.value == 'user' else 'Assistant'}: {message.content}"
+        for message in messages
+    )
+    return [
+        SystemMessage(content=(
+            "You maintain a running summary of a restaurant ordering chat. Keep facts that matter "
+            "for later turns: items discussed or ordered, order IDs and statuses, customer name, phone, "
+            "email, address and preferences, and open questions. Drop greetings and small talk. "
+            f"Reply with the updated summary only, at most {CONTEXT_SUMMARY_MAX_WORDS} words."
+        )),
+        HumanMessage(content=f"Current summary:\n{previous_summary or '(none)'}\n\nNew turns:\n{transcript}")
+    ]
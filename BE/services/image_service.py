@@ -1,10 +1,24 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import Any, BinaryIO, Dict, Optional, Tuple
 import cloudinary
 import cloudinary.uploader
 from fastapi import UploadFile
-import json
-import os
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
 from dotenv import load_dotenv
 
+from database.tenant_db import TenantDatabase
+from models.tenant_models import Upload
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Optional: uploads are stored as received
+    Image = None
+
 load_dotenv()
 
 # Configure Cloudinary
@@ -14,23 +28,207 @@ cloudinary.config(
     api_secret=os.getenv("CLOUDINARY_API_SECRET")
 )
 
-async def upload_image(file: UploadFile) -> str:
-    """Upload image to Cloudinary and return URL"""
-    
-    try:
-        # Read file content
-        file_content = await file.read()
-        
-        # Upload to Cloudinary
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", 10 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Uploads above this stay on disk while they are processed
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", 1024 * 1024))
+# Longest side after downscaling (needs Pillow)
+UPLOAD_MAX_DIMENSION = int(os.getenv("UPLOAD_MAX_DIMENSION", 1600))
+UPLOAD_JPEG_QUALITY = int(os.getenv("UPLOAD_JPEG_QUALITY", 82))
+UPLOAD_STORAGE = os.getenv("UPLOAD_STORAGE", "cloudinary")  # cloudinary | local
+UPLOAD_LOCAL_DIR = os.getenv("UPLOAD_LOCAL_DIR", "uploads")
+UPLOAD_LOCAL_BASE_URL = os.getenv("UPLOAD_LOCAL_BASE_URL", "/uploads")
+
+# ISO-BMFF brands of HEIC/HEIF photos (iPhone default); Pillow cannot decode them without a plugin
+HEIF_BRANDS = {b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis", b"mif1", b"msf1"}
+# Formats stored as received when Pillow cannot decode them
+PASSTHROUGH_EXTENSIONS = {".heic"}
+
+class UploadTooLarge(ValueError):
+    """Upload is over UPLOAD_MAX_BYTES"""
+
+class InvalidImage(ValueError):
+    """Upload is not a readable image"""
+
+class CloudinaryStorage:
+    """Stores images in Cloudinary"""
+
+    def save(self, data: BinaryIO, folder: str, name: str) -> str:
         upload_result = cloudinary.uploader.upload(
-            file_content,
-            folder="restaurant_payments",
+            data,
+            folder=folder,
+            public_id=os.path.splitext(name)[0],
             resource_type="image",
             quality="auto",
             fetch_format="auto"
         )
-        
         return upload_result["secure_url"]
-        
+
+class LocalStorage:
+    """Stores images on the local filesystem (development and tests)"""
+
+    def __init__(self, root: str = UPLOAD_LOCAL_DIR, base_url: str = UPLOAD_LOCAL_BASE_URL):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def save(self, data: BinaryIO, folder: str, name: str) -> str:
+        directory = os.path.join(self.root, folder)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, name), "wb") as target:
+            shutil.copyfileobj(data, target)
+        return f"{self.base_url}/{folder}/{name}"
+
+_storage = None
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        _storage = LocalStorage() if UPLOAD_STORAGE == "local" else CloudinaryStorage()
+    return _storage
+
+async def read_upload(file: UploadFile, max_bytes: int = UPLOAD_MAX_BYTES) -> BinaryIO:
+    """Copy an upload into a spooled temp file in chunks, refusing anything over ``max_bytes``.
+
+    UploadLimitMiddleware bounds the request body; this bounds the file part itself.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLarge(f"Image is larger than {max_bytes // (1024 * 1024)} MB")
+
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+    total = 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            spool.close()
+            raise UploadTooLarge(f"Image is larger than {max_bytes // (1024 * 1024)} MB")
+        spool.write(chunk)
+
+    if total == 0:
+        spool.close()
+        raise InvalidImage("Image is empty")
+    spool.seek(0)
+    return spool
+
+def sniff_image_type(data: BinaryIO) -> Optional[str]:
+    """Extension of a supported image format from its magic bytes, or None"""
+    data.seek(0)
+    head = data.read(16)
+    data.seek(0)
+    if head.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return ".gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    if head[4:8] == b"ftyp" and head[8:12] in HEIF_BRANDS:
+        return ".heic"
+    return None
+
+def shrink_image(data: BinaryIO) -> Tuple[BinaryIO, str]:
+    """Downscale and re-encode an image as JPEG when that makes it smaller.
+
+    Returns the data to store and its extension. Only known image formats
+    are accepted; HEIC is stored as received when Pillow cannot decode it.
+    Blocking; run it off the event loop.
+    """
+    extension = sniff_image_type(data)
+    if extension is None:
+        raise InvalidImage("File is not a supported image (JPEG, PNG, GIF, WebP or HEIC)")
+    if Image is None:
+        return data, extension
+
+    try:
+        with Image.open(data) as image:
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((UPLOAD_MAX_DIMENSION, UPLOAD_MAX_DIMENSION))
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            shrunk = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+            image.save(shrunk, format="JPEG", quality=UPLOAD_JPEG_QUALITY, optimize=True)
     except Exception as e:
-        raise Exception(f"Image upload failed: {str(e)}")
\ No newline at end of file
+        if extension not in PASSTHROUGH_EXTENSIONS:
+            raise InvalidImage(f"Could not read image: {str(e)}")
+        # Store the phone photo as sent rather than rejecting a format we cannot shrink
+        print(f"Could not shrink {extension} image, keeping the original: {str(e)}")
+        data.seek(0)
+        return data, extension
+
+    data.seek(0, os.SEEK_END)
+    if shrunk.tell() >= data.tell():
+        shrunk.close()
+        data.seek(0)
+        return data, extension
+    data.close()
+    shrunk.seek(0)
+    return shrunk, ".jpg"
+
+def content_hash(data: BinaryIO) -> Tuple[str, int]:
+    """SHA-256 hex digest and size of a file, read in chunks and rewound"""
+    digest = hashlib.sha256()
+    size = 0
+    data.seek(0)
+    for chunk in iter(lambda: data.read(UPLOAD_CHUNK_SIZE), b""):
+        digest.update(chunk)
+        size += len(chunk)
+    data.seek(0)
+    return digest.hexdigest(), size
+
+def normalize_image(data: BinaryIO) -> Tuple[BinaryIO, str, str, int]:
+    """Shrink an image and hash the result: (data, extension, sha256, size). Blocking."""
+    data, extension = shrink_image(data)
+    digest, size = content_hash(data)
+    return data, extension, digest, size
+
+async def upload_image(file: UploadFile, folder: str = "restaurant_payments", tenant_db: Optional[TenantDatabase] = None) -> Dict[str, Any]:
+    """Stream an uploaded image through size checks and optional shrinking into storage.
+
+    With a ``tenant_db``, images are deduplicated per tenant by the SHA-256 of
+    their normalized bytes: re-uploading the same image returns the stored URL
+    without another upload. Returns ``url``, ``content_hash`` and
+    ``deduplicated``.
+    """
+    data = await read_upload(file)
+    try:
+        data, extension, digest, size = await asyncio.to_thread(normalize_image, data)
+
+        if tenant_db is not None:
+            url = await _find_upload(tenant_db, digest)
+            if url:
+                return {"url": url, "content_hash": digest, "deduplicated": True}
+
+        # Content-addressed name, so a racing duplicate overwrites the same object
+        name = f"{digest}{extension}"
+
+        url = await asyncio.to_thread(get_storage().save, data, folder, name)
+        if tenant_db is not None:
+            url = await _remember_upload(tenant_db, digest, url, size)
+        return {"url": url, "content_hash": digest, "deduplicated": False}
+    finally:
+        data.close()
+
+async def _find_upload(tenant_db: TenantDatabase, digest: str) -> Optional[str]:
+    db = tenant_db.get_async_session()
+    try:
+        result = await db.execute(select(Upload.url).filter(Upload.content_hash == digest))
+        return result.scalar()
+    finally:
+        await db.close()
+
+async def _remember_upload(tenant_db: TenantDatabase, digest: str, url: str, size: int) -> str:
+    """Record a stored image; if a concurrent upload recorded it first, use that URL"""
+    db = tenant_db.get_async_session()
+    try:
+        await db.execute(
+            insert(Upload).values(content_hash=digest, url=url, size_bytes=size)
+            .on_conflict_do_nothing(index_elements=[Upload.content_hash])
+        )
+        await db.commit()
+        result = await db.execute(select(Upload.url).filter(Upload.content_hash == digest))
+        return result.scalar() or url
+    finally:
+        await db.close()
@@ -0,0 +1,216 @@
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Pattern
+
+# Messages answered locally must reach this confidence; anything lower goes to the LLM
+INTENT_MIN_CONFIDENCE = float(os.getenv("INTENT_MIN_CONFIDENCE", 0.8))
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "true").lower() == "true"
+INTENT_STATS_LOG_EVERY = int(os.getenv("INTENT_STATS_LOG_EVERY", 100))  # messages
+
+UUID_PATTERN = r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+NEGATION_RE = re.compile(r"\b(don'?t|do not|not|never|no)\b", re.IGNORECASE)
+# Item ids and the header list_menu adds for the assistant; customers never see them
+MENU_ID_RE = re.compile(r" \[ID: [^\]]*\]$", re.MULTILINE)
+MENU_HEADER = "Available Menu Items:\n"
+
+class IntentMatch:
+    """A message resolved to one tool call"""
+
+    def __init__(self, intent: str, tool: str, args: Dict[str, Any], confidence: float, respond: Callable[[str], str]):
+        self.intent = intent
+        self.tool = tool
+        self.args = args
+        self.confidence = confidence
+        self.respond = respond
+
+class IntentRule:
+    """Regex rule mapping a message onto a tool call.
+
+    ``build_args`` turns the regex match into tool arguments and ``respond``
+    turns the tool output into the reply. Messages containing a negation get
+    ``confidence`` halved, so "don't cancel ..." falls through to the LLM.
+    """
+
+    def __init__(
+        self,
+        intent: str,
+        tool: str,
+        pattern: str,
+        build_args: Callable[[re.Match], Dict[str, Any]],
+        respond: Callable[[str], str] = lambda output: output,
+        confidence: float = 0.95
+    ):
+        self.intent = intent
+        self.tool = tool
+        self.pattern: Pattern = re.compile(pattern, re.IGNORECASE)
+        self.build_args = build_args
+        self.respond = respond
+        self.confidence = confidence
+
+    def match(self, content: str) -> Optional[IntentMatch]:
+        found = self.pattern.search(content)
+        if not found:
+            return None
+        confidence = self.confidence / 2 if NEGATION_RE.search(content) else self.confidence
+        return IntentMatch(self.intent, self.tool, self.build_args(found), confidence, self.respond)
+
+class KeywordClassifier:
+    """Tiny bag-of-words fallback for short messages the regex rules miss.
+
+    Confidence is the share of the message's words that are intent keywords,
+    so only terse messages like "menu please" score high enough.
+    """
+
+    def __init__(self, intents: Dict[str, Dict[str, Any]]):
+        # intent -> {"tool", "keywords", "required", "args", "respond"}
+        self.intents = intents
+
+    def classify(self, content: str) -> Optional[IntentMatch]:
+        words = re.findall(r"[a-z']+", content.lower())
+        if not words or len(words) > 6:
+            return None
+
+        best = None
+        for intent, spec in self.intents.items():
+            if spec.get("required") and not spec["required"] & set(words):
+                continue
+            confidence = sum(1 for word in words if word in spec["keywords"]) / len(words)
+            if best is None or confidence > best.confidence:
+                best = IntentMatch(intent, spec["tool"], dict(spec.get("args", {})), confidence, spec.get("respond", lambda output: output))
+        return best
+
+class IntentRouter:
+    """Answers simple, unambiguous messages through the tools without calling the LLM"""
+
+    def __init__(self, rules: List[IntentRule], classifier: Optional[KeywordClassifier] = None, min_confidence: float = INTENT_MIN_CONFIDENCE):
+        self.rules = list(rules)
+        self.classifier = classifier
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self._messages = 0
+        self._hits: Dict[str, int] = {}
+        self._fast_path_ms = 0.0
+        self._llm_turn_ms: Optional[float] = None  # Moving average of full LLM turns
+
+    def add_rule(self, rule: IntentRule):
+        self.rules.append(rule)
+
+    def route(self, content: str) -> Optional[IntentMatch]:
+        """Best local match for a message, or None when the LLM should handle it"""
+        content = content.strip()
+        best = None
+        for rule in self.rules:
+            match = rule.match(content)
+            if match is not None and (best is None or match.confidence > best.confidence):
+                best = match
+        if best is None and self.classifier is not None:
+            best = self.classifier.classify(content)
+        if best is None or best.confidence < self.min_confidence:
+            return None
+        return best
+
+    def record_fast_path(self, intent: str, latency_ms: float):
+        with self._lock:
+            self._messages += 1
+            self._hits[intent] = self._hits.get(intent, 0) + 1
+            self._fast_path_ms += latency_ms
+            should_log = self._messages % INTENT_STATS_LOG_EVERY == 0
+        if should_log:
+            self._log()
+
+    def record_llm_turn(self, latency_ms: float):
+        with self._lock:
+            self._messages += 1
+            if self._llm_turn_ms is None:
+                self._llm_turn_ms = latency_ms
+            else:
+                self._llm_turn_ms = 0.9 * self._llm_turn_ms + 0.1 * latency_ms
+            should_log = self._messages % INTENT_STATS_LOG_EVERY == 0
+        if should_log:
+            self._log()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = sum(self._hits.values())
+            average_fast_ms = self._fast_path_ms / hits if hits else 0.0
+            saved_ms = hits * (self._llm_turn_ms - average_fast_ms) if hits and self._llm_turn_ms else 0.0
+            return {
+                "messages": self._messages,
+                "fast_path_hits": hits,
+                "hit_rate": round(hits / self._messages, 4) if self._messages else 0.0,
+                "hits_by_intent": dict(self._hits),
+                "avg_fast_path_ms": round(average_fast_ms, 1),
+                "avg_llm_turn_ms": round(self._llm_turn_ms, 1) if self._llm_turn_ms else None,
+                "estimated_saved_ms": round(max(saved_ms, 0.0), 1)
+            }
+
+    def _log(self):
+        stats = self.stats()
+        print(f"Intent router: {stats['fast_path_hits']}/{stats['messages']} messages answered locally ({stats['hit_rate']:.1%}), ~{stats['estimated_saved_ms'] / 1000:.1f}s of LLM time saved")
+
+def _details_saved(label: str) -> Callable[[str], str]:
+    def respond(output: str) -> str:
+        if output == "Customer details updated successfully":
+            return f"Thanks! I've saved your {label}."
+        return output
+    return respond
+
+def _customer_menu(output: str) -> str:
+    """Turn list_menu's assistant-facing text into a reply for the customer"""
+    if not output.startswith(MENU_HEADER):
+        return "Sorry, there's nothing on the menu right now."
+    return "Here's our menu:\n\n" + MENU_ID_RE.sub("", output[len(MENU_HEADER):]).rstrip()
+
+DEFAULT_RULES = [
+    IntentRule(
+        "order_status", "get_order_status",
+        rf"^(?:what(?:'s| is) the )?(?:status|track(?:ing)?|check|where(?:'s| is))\b[\w\s]*?\border\b\D*?({UUID_PATTERN})\W*$",
+        lambda m: {"order_id": m.group(1)}
+    ),
+    IntentRule(
+        "order_status", "get_order_status",
+        rf"^({UUID_PATTERN})\s+status\W*$",
+        lambda m: {"order_id": m.group(1)}
+    ),
+    IntentRule(
+        "cancel_order", "cancel_order",
+        rf"^(?:please )?cancel (?:my )?order\D*?({UUID_PATTERN})\W*$",
+        lambda m: {"order_id": m.group(1)}
+    ),
+    IntentRule(
+        "show_menu", "list_menu",
+        r"^(?:(?:can i |could i )?(?:show|see|view|display|send)(?: me)? )?(?:the |your )?(?:full )?menu(?: please)?\W*$",
+        lambda m: {},
+        respond=_customer_menu
+    ),
+    IntentRule(
+        "set_phone", "amend_session_details",
+        r"^(?:(?:my )?(?:phone|number|mobile|contact)(?: number)?(?: is|:)?\s*)?(\+?\d[\d\s\-()]{6,18}\d)$",
+        lambda m: {"phone": m.group(1)},
+        respond=_details_saved("phone number")
+    ),
+    IntentRule(
+        "set_email", "amend_session_details",
+        r"^(?:(?:my )?email(?: address)?(?: is|:)?\s*)?([\w.+-]+@[\w-]+\.[\w.-]+)$",
+        lambda m: {"email": m.group(1)},
+        respond=_details_saved("email")
+    ),
+    IntentRule(
+        "set_address", "amend_session_details",
+        r"^(?:my )?(?:delivery )?address(?: is|:)\s*(.{8,300})$",
+        lambda m: {"address": m.group(1).strip()},
+        respond=_details_saved("delivery address")
+    ),
+]
+
+DEFAULT_CLASSIFIER = KeywordClassifier({
+    "show_menu": {
+        "tool": "list_menu",
+        "keywords": {"menu", "show", "please", "the", "your", "full", "see", "me"},
+        "required": {"menu"},
+        "respond": _customer_menu
+    }
+})
+
+intent_router = IntentRouter(DEFAULT_RULES, DEFAULT_CLASSIFIER)
@@ -0,0 +1,251 @@
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import select, func
+
+from database.tenant_db import TenantDatabase
+from models.tenant_models import MenuItem
+from services import cache_bus
+from services.menu_search import MenuSearchIndex
+from services.pricing import PriceTable
+from utils.http_cache import json_body, make_etag
+
+# Items the assistant receives for a menu search
+MENU_SEARCH_TOP_K = int(os.getenv("MENU_SEARCH_TOP_K", 8))
+# A snapshot is re-validated against the database this often (catches other workers' and direct edits)
+MENU_CACHE_CHECK_SECONDS = int(os.getenv("MENU_CACHE_CHECK_SECONDS", 30))
+# ...and rebuilt outright after this long, for edits that leave updated_at untouched
+MENU_CACHE_TTL = int(os.getenv("MENU_CACHE_TTL", 600))
+
+def _menu_query():
+    return select(MenuItem).filter(MenuItem.available == True).order_by(MenuItem.created_at, MenuItem.id)
+
+def _fingerprint_query():
+    """Row count and latest edit across all menu items; changes on any insert, update or delete"""
+    return select(func.count(MenuItem.id), func.max(MenuItem.updated_at))
+
+def menu_item_to_entry(item: MenuItem) -> Dict[str, Any]:
+    """Parse a MenuItem row, including its JSON columns, into a plain dict"""
+    return {
+        "id": str(item.id),
+        "menu_id": str(item.menu_id),
+        "name": item.name,
+        "description": item.description,
+        "price": float(item.price),
+        "category": item.category,
+        "image_url": item.image_url,
+        "is_vegetarian": item.is_vegetarian,
+        "is_vegan": item.is_vegan,
+        "spice_level": item.spice_level,
+        "preparation_time": item.preparation_time,
+        "available": item.available,
+        "sizes": item.get_sizes(),
+        "deals": item.get_deals(),
+        "servings": item.get_servings()
+    }
+
+def render_menu_line(entry: Dict[str, Any], serving_prices: Optional[List[Any]] = None) -> str:
+    """Render one menu item the way the assistant sees it.
+
+    ``serving_prices`` are the compiled per-serving prices; without them they
+    are derived from the base price and multipliers.
+    """
+    line = f"- {entry['name']}"
+
+    # Add base price
+    line += f" - Base: ${entry['price']:.2f}"
+
+    # Add sizes if available
+    if entry["sizes"]:
+        line += " | Sizes: " + ", ".join(f"{size['name']} (${size['price']:.2f})" for size in entry["sizes"])
+
+    # Add deals if available
+    if entry["deals"]:
+        deal_info = []
+        for deal in entry["deals"]:
+            deal_text = deal['name']
+            if deal.get('discount_percentage'):
+                deal_text += f" ({deal['discount_percentage']}% off)"
+            elif deal.get('discount_amount'):
+                deal_text += f" (${deal['discount_amount']} off)"
+            deal_info.append(deal_text)
+        line += " | Deals: " + ", ".join(deal_info)
+
+    # Add servings if available
+    if entry["servings"]:
+        if serving_prices is None:
+            serving_prices = [entry['price'] * serving['price_multiplier'] for serving in entry["servings"]]
+        line += " | Servings: " + ", ".join(
+            f"{serving['name']} (${price:.2f})" for serving, price in zip(entry["servings"], serving_prices)
+        )
+
+    if entry["description"]:
+        line += f": {entry['description']}"
+
+    # Add dietary info
+    dietary_info = []
+    if entry["is_vegetarian"]:
+        dietary_info.append("Vegetarian")
+    if entry["is_vegan"]:
+        dietary_info.append("Vegan")
+    if entry["spice_level"] > 0:
+        dietary_info.append(f"Spice Level: {entry['spice_level']}/5")
+    if dietary_info:
+        line += f" ({', '.join(dietary_info)})"
+
+    return line + f" [ID: {entry['id']}]\n"
+
+class MenuSnapshot:
+    """Available menu items of one tenant at a given revision, parsed, priced and pre-rendered"""
+
+    def __init__(self, revision: int, items: List[Dict[str, Any]], previous_index: Optional[MenuSearchIndex] = None, fingerprint: Optional[Tuple] = None):
+        self.revision = revision
+        self.items = items
+        self.fingerprint = fingerprint
+        self.built_at = self.checked_at = time.monotonic()
+        self.search_index = previous_index.update(items) if previous_index else MenuSearchIndex(items)
+        self.pricing = PriceTable(items)
+        self.lines = [render_menu_line(entry, self.pricing.serving_prices(entry["id"])) for entry in items]
+        self.text = self._render(self.lines)
+        self.public_items = [{
+            "id": entry["id"],
+            "name": entry["name"],
+            "description": entry["description"],
+            "price": entry["price"],
+            "available": entry["available"]
+        } for entry in items]
+        self.body = json_body(self.public_items)
+        self.etag = make_etag(self.body)
+
+    def find(self, search: Optional[str] = None) -> List[int]:
+        """Positions of items whose name contains ``search`` (case-insensitive)"""
+        if not search:
+            return list(range(len(self.items)))
+        term = search.lower()
+        return [i for i, entry in enumerate(self.items) if term in entry["name"].lower()]
+
+    def public_body(self, search: Optional[str] = None) -> bytes:
+        """Serialized public menu (GET /menu), optionally filtered by name"""
+        if not search:
+            return self.body
+        return json_body([self.public_items[i] for i in self.find(search)])
+
+    def search(self, query: str, k: int = MENU_SEARCH_TOP_K) -> List[int]:
+        """Positions of the most relevant items (BM25 over name, category and description)"""
+        return self.search_index.search(query, k) or self.find(query)[:k]
+
+    def render(self, search: Optional[str] = None) -> str:
+        """Menu text for the assistant: the whole menu, or the top matches for a search"""
+        if not search:
+            return self.text
+        return self._render([self.lines[i] for i in self.search(search)])
+
+    @staticmethod
+    def _render(lines: List[str]) -> str:
+        if not lines:
+            return "No menu items found."
+        return "Available Menu Items:\n" + "".join(lines)
+
+class MenuCache:
+    """Per-tenant menu snapshots keyed by restaurant id.
+
+    Each tenant has a revision counter that admin menu writes bump; a
+    snapshot is served only while its revision is current, so a rebuild that
+    raced with a write is never cached. Snapshots are also re-checked against
+    the menu_items row count and latest updated_at every
+    MENU_CACHE_CHECK_SECONDS and rebuilt after MENU_CACHE_TTL, so edits from
+    other workers (without Redis) or made directly in the database show up.
+    """
+
+    def __init__(self):
+        self._revisions: Dict[str, int] = {}
+        self._snapshots: Dict[str, MenuSnapshot] = {}
+        # Last search index per tenant, kept across revisions for incremental rebuilds
+        self._search_indexes: Dict[str, MenuSearchIndex] = {}
+        self._lock = threading.Lock()
+
+    async def get(self, restaurant_id: str, tenant_db: TenantDatabase) -> MenuSnapshot:
+        snapshot, revision = self._lookup(restaurant_id)
+        if snapshot is not None and not self._due_for_check(snapshot):
+            return snapshot
+
+        db = tenant_db.get_async_session()
+        try:
+            fingerprint = tuple((await db.execute(_fingerprint_query())).one())
+            if self._still_valid(snapshot, fingerprint):
+                return snapshot
+            result = await db.execute(_menu_query())
+            items = [menu_item_to_entry(item) for item in result.scalars().all()]
+        finally:
+            await db.close()
+        return self._store(restaurant_id, self._build(restaurant_id, revision, items, fingerprint))
+
+    def get_sync(self, restaurant_id: str, tenant_db: TenantDatabase) -> MenuSnapshot:
+        """Same as get, for code running in worker threads"""
+        snapshot, revision = self._lookup(restaurant_id)
+        if snapshot is not None and not self._due_for_check(snapshot):
+            return snapshot
+
+        db = tenant_db.get_session()
+        try:
+            fingerprint = tuple(db.execute(_fingerprint_query()).one())
+            if self._still_valid(snapshot, fingerprint):
+                return snapshot
+            items = [menu_item_to_entry(item) for item in db.execute(_menu_query()).scalars().all()]
+        finally:
+            db.close()
+        return self._store(restaurant_id, self._build(restaurant_id, revision, items, fingerprint))
+
+    @staticmethod
+    def _due_for_check(snapshot: MenuSnapshot) -> bool:
+        return time.monotonic() - snapshot.checked_at >= MENU_CACHE_CHECK_SECONDS
+
+    @staticmethod
+    def _still_valid(snapshot: Optional[MenuSnapshot], fingerprint: Tuple) -> bool:
+        """Whether a snapshot due for a check still matches the database"""
+        if snapshot is None or snapshot.fingerprint != fingerprint:
+            return False
+        if time.monotonic() - snapshot.built_at >= MENU_CACHE_TTL:
+            return False
+        snapshot.checked_at = time.monotonic()
+        return True
+
+    def bump(self, restaurant_id: str, broadcast: bool = True):
+        """Mark a tenant's menu as changed, optionally on every worker"""
+        with self._lock:
+            self._revisions[restaurant_id] = self._revisions.get(restaurant_id, 0) + 1
+            self._snapshots.pop(restaurant_id, None)
+        if broadcast:
+            cache_bus.publish_invalidation("menu", restaurant_id)
+
+    def invalidate(self, restaurant_id: str):
+        """Forget a tenant entirely (restaurant removed or moved to another database)"""
+        self.bump(restaurant_id, broadcast=False)
+        with self._lock:
+            self._search_indexes.pop(restaurant_id, None)
+
+    def _build(self, restaurant_id: str, revision: int, items: List[Dict[str, Any]], fingerprint: Optional[Tuple] = None) -> MenuSnapshot:
+        with self._lock:
+            previous_index = self._search_indexes.get(restaurant_id)
+        return MenuSnapshot(revision, items, previous_index, fingerprint)
+
+    def _lookup(self, restaurant_id: str):
+        with self._lock:
+            revision = self._revisions.get(restaurant_id, 0)
+            snapshot = self._snapshots.get(restaurant_id)
+        if snapshot is not None and snapshot.revision == revision:
+            return snapshot, revision
+        return None, revision
+
+    def _store(self, restaurant_id: str, snapshot: MenuSnapshot) -> MenuSnapshot:
+        with self._lock:
+            if self._revisions.get(restaurant_id, 0) == snapshot.revision:
+                self._snapshots[restaurant_id] = snapshot
+                self._search_indexes[restaurant_id] = snapshot.search_index
+        return snapshot
+
+menu_cache = MenuCache()
+
+cache_bus.register_handler("menu", lambda restaurant_id: menu_cache.bump(restaurant_id, broadcast=False))
+cache_bus.register_handler("restaurant", menu_cache.invalidate)
@@ -0,0 +1,158 @@
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+# BM25 parameters and field boosts (name matches count most)
+BM25_K1 = 1.2
+BM25_B = 0.75
+FIELD_WEIGHTS = {"name": 3.0, "category": 1.5, "description": 1.0}
+
+# Query terms missing from the vocabulary are matched to terms sharing this
+# fraction of trigrams (Jaccard), which absorbs most single-letter typos
+TYPO_MIN_SIMILARITY = float(os.getenv("MENU_SEARCH_TYPO_SIMILARITY", 0.4))
+TYPO_MAX_EXPANSIONS = 2
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# A few common menu synonyms, expanded at query time
+SYNONYMS = {
+    "soda": ["drink", "beverage"],
+    "drink": ["beverage"],
+    "fries": ["chips"],
+    "chips": ["fries"],
+    "veg": ["vegetarian"],
+    "spicy": ["hot"],
+    "hot": ["spicy"],
+    "burger": ["sandwich"],
+    "dessert": ["sweet"],
+}
+
+def _stem(token: str) -> str:
+    """Light plural folding: 'burgers' -> 'burger', 'dishes' -> 'dish', 'berries' -> 'berry'"""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith(("ches", "shes", "xes")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return [_stem(token) for token in _TOKEN_RE.findall(text.lower())]
+
+# Query terms are stemmed before lookup, so the table must be too
+_SYNONYMS = {_stem(term): [_stem(synonym) for synonym in synonyms] for term, synonyms in SYNONYMS.items()}
+
+def _trigrams(term: str) -> set:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _document_terms(entry: Dict[str, Any]) -> Dict[str, float]:
+    """Field-weighted term frequencies for one menu item"""
+    weights: Dict[str, float] = defaultdict(float)
+    for field, boost in FIELD_WEIGHTS.items():
+        for term, count in Counter(tokenize(entry.get(field))).items():
+            weights[term] += boost * count
+    return dict(weights)
+
+def _signature(entry: Dict[str, Any]) -> Tuple:
+    return tuple(entry.get(field) for field in FIELD_WEIGHTS)
+
+class MenuSearchIndex:
+    """In-memory BM25 inverted index over menu item name, category and description.
+
+    Postings hold precomputed BM25 term weights, so a query is a handful of
+    NumPy scatter-adds. Build from the previous index with ``update`` to
+    re-tokenize only items whose searchable text changed.
+    """
+
+    def __init__(self, items: List[Dict[str, Any]], documents: Optional[Dict[str, Tuple[Tuple, Dict[str, float]]]] = None):
+        self.ids = [entry["id"] for entry in items]
+        self.documents = {}
+        reused = documents or {}
+        for entry in items:
+            signature = _signature(entry)
+            cached = reused.get(entry["id"])
+            if cached is not None and cached[0] == signature:
+                self.documents[entry["id"]] = cached
+            else:
+                self.documents[entry["id"]] = (signature, _document_terms(entry))
+        self._build()
+
+    def update(self, items: List[Dict[str, Any]]) -> "MenuSearchIndex":
+        """New index for ``items``, reusing the term vectors of unchanged items"""
+        return MenuSearchIndex(items, self.documents)
+
+    def _build(self):
+        doc_terms = [self.documents[item_id][1] for item_id in self.ids]
+        count = len(doc_terms)
+        lengths = np.array([sum(terms.values()) for terms in doc_terms], dtype=np.float32)
+        average_length = float(lengths.mean()) if count and lengths.mean() > 0 else 1.0
+        norms = BM25_K1 * (1 - BM25_B + BM25_B * lengths / average_length)
+
+        postings: Dict[str, Tuple[List[int], List[float]]] = defaultdict(lambda: ([], []))
+        for position, terms in enumerate(doc_terms):
+            for term, tf in terms.items():
+                docs, tfs = postings[term]
+                docs.append(position)
+                tfs.append(tf)
+
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for term, (docs, tfs) in postings.items():
+            docs_array = np.array(docs, dtype=np.int32)
+            tf_array = np.array(tfs, dtype=np.float32)
+            idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            weights = idf * tf_array * (BM25_K1 + 1) / (tf_array + norms[docs_array])
+            self.postings[term] = (docs_array, weights.astype(np.float32))
+
+        # Trigram -> vocabulary term ids, for typo-tolerant lookups
+        self.vocabulary = list(self.postings)
+        self._trigram_sizes = np.array([len(_trigrams(term)) for term in self.vocabulary], dtype=np.float32)
+        trigram_terms: Dict[str, List[int]] = defaultdict(list)
+        for term_id, term in enumerate(self.vocabulary):
+            for trigram in _trigrams(term):
+                trigram_terms[trigram].append(term_id)
+        self._trigram_terms = {trigram: np.array(ids, dtype=np.int32) for trigram, ids in trigram_terms.items()}
+
+    def _expand(self, term: str) -> List[Tuple[str, float]]:
+        """Vocabulary terms for a query term, with a confidence weight"""
+        matches = []
+        if term in self.postings:
+            matches.append((term, 1.0))
+        for synonym in _SYNONYMS.get(term, []):
+            if synonym in self.postings:
+                matches.append((synonym, 0.8))
+        if matches or len(term) < 3 or not self.vocabulary:
+            return matches
+
+        grams = _trigrams(term)
+        hits = [self._trigram_terms[g] for g in grams if g in self._trigram_terms]
+        if not hits:
+            return matches
+        shared = np.bincount(np.concatenate(hits), minlength=len(self.vocabulary)).astype(np.float32)
+        similarity = shared / (len(grams) + self._trigram_sizes - shared)
+        for term_id in np.argsort(-similarity)[:TYPO_MAX_EXPANSIONS]:
+            if similarity[term_id] >= TYPO_MIN_SIMILARITY:
+                matches.append((self.vocabulary[term_id], float(similarity[term_id])))
+        return matches
+
+    def search(self, query: str, k: int = 10) -> List[int]:
+        """Positions of the top ``k`` matching items, best first"""
+        if not self.ids:
+            return []
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            for match, confidence in self._expand(term):
+                docs, weights = self.postings[match]
+                np.add.at(scores, docs, confidence * weights)
+
+        matched = np.flatnonzero(scores > 0)
+        if matched.size == 0:
+            return []
+        top = matched[np.argsort(-scores[matched], kind="stable")[:k]]
+        return top.tolist()
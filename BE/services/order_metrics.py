@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+from sqlalchemy import select, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.tenant_models import Order, OrderStatus, PaymentStatus
+from services import cache_bus
+
+load_dotenv()
+
+METRICS_WINDOW_HOURS = 24
+# Counters are re-read from the database this often, so orders ageing out of the window drop off
+METRICS_RESYNC_SECONDS = int(os.getenv("METRICS_RESYNC_SECONDS", 300))
+METRICS_CACHE_SIZE = int(os.getenv("METRICS_CACHE_SIZE", 1000))  # tenants
+
+OPEN_STATUSES = (OrderStatus.pending, OrderStatus.confirmed, OrderStatus.in_process)
+
+def empty_metrics() -> Dict[str, Any]:
+    return {"revenue_24h": 0.0, "delivered_24h": 0, "total_orders_24h": 0, "pending_orders": 0}
+
+async def load_metrics(db: AsyncSession) -> Dict[str, Any]:
+    """All dashboard metrics in one pass over orders, using FILTER aggregates"""
+    since = datetime.utcnow() - timedelta(hours=METRICS_WINDOW_HOURS)
+    in_window = Order.created_at >= since
+
+    row = (await db.execute(
+        select(
+            func.coalesce(func.sum(Order.total_price).filter(in_window, Order.payment_status == PaymentStatus.paid), 0),
+            func.count().filter(Order.status == OrderStatus.delivered, Order.updated_at >= since),
+            func.count().filter(in_window),
+            func.count().filter(Order.status.in_(OPEN_STATUSES))
+        ).filter(
+            # Only rows some aggregate can count; lets the planner BitmapOr the indexes instead of scanning orders
+            or_(in_window, Order.updated_at >= since, Order.status.in_(OPEN_STATUSES))
+        )
+    )).one()
+
+    return {
+        "revenue_24h": float(row[0] or 0),
+        "delivered_24h": row[1] or 0,
+        "total_orders_24h": row[2] or 0,
+        "pending_orders": row[3] or 0
+    }
+
+def order_state(order: Order) -> Dict[str, Any]:
+    """The fields of an order the metrics depend on, captured before or after a write"""
+    return {
+        "status": order.status,
+        "payment_status": order.payment_status,
+        "total_price": float(order.total_price or 0),
+        "created_at": order.created_at or datetime.utcnow(),
+        "updated_at": order.updated_at or datetime.utcnow()
+    }
+
+def _contribution(state: Optional[Dict[str, Any]], since: datetime) -> Dict[str, Any]:
+    """What one order adds to each metric, mirroring the filters in load_metrics"""
+    metrics = empty_metrics()
+    if state is None:
+        return metrics
+    in_window = state["created_at"] >= since
+    if in_window and state["payment_status"] == PaymentStatus.paid:
+        metrics["revenue_24h"] = state["total_price"]
+    if state["status"] == OrderStatus.delivered and state["updated_at"] >= since:
+        metrics["delivered_24h"] = 1
+    if in_window:
+        metrics["total_orders_24h"] = 1
+    if state["status"] in OPEN_STATUSES:
+        metrics["pending_orders"] = 1
+    return metrics
+
+class OrderMetrics:
+    """Per-tenant dashboard counters kept current by the order writes themselves.
+
+    A tenant's counters are seeded with ``load_metrics`` and then adjusted by
+    ``record_change`` on every order write, so polling the dashboard costs no
+    query until the counters are due for a resync.
+
+    Each tenant has a generation that every change bumps. A load that saw the
+    generation move cannot tell whether those writes are in its totals (they
+    are recorded after their commit), so its result is served once and
+    reloaded on the next poll instead of being trusted until the next resync.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Dict[str, Any]] = {}
+        self._synced_at: Dict[str, float] = {}
+        self._generations: Dict[str, int] = {}
+
+    async def get(self, restaurant_id: str, db: AsyncSession) -> Dict[str, Any]:
+        with self._lock:
+            metrics = self._metrics.get(restaurant_id)
+            if metrics is not None and time.monotonic() - self._synced_at[restaurant_id] < METRICS_RESYNC_SECONDS:
+                return dict(metrics)
+            generation = self._generations.get(restaurant_id, 0)
+
+        metrics = await load_metrics(db)
+        with self._lock:
+            self._metrics.pop(restaurant_id, None)
+            self._metrics[restaurant_id] = dict(metrics)
+            if self._generations.get(restaurant_id, 0) == generation:
+                self._synced_at[restaurant_id] = time.monotonic()
+            else:
+                # An order changed mid-load: keep applying changes, but reload on the next poll
+                self._synced_at[restaurant_id] = float("-inf")
+            while len(self._metrics) > METRICS_CACHE_SIZE:
+                oldest = next(iter(self._metrics))
+                self._metrics.pop(oldest)
+                self._synced_at.pop(oldest, None)
+        return metrics
+
+    def record_change(self, restaurant_id: str, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]], broadcast: bool = True):
+        """Apply an order write (``before`` is None for new orders) to the tenant's counters"""
+        since = datetime.utcnow() - timedelta(hours=METRICS_WINDOW_HOURS)
+        old, new = _contribution(before, since), _contribution(after, since)
+        with self._lock:
+            self._generations[restaurant_id] = self._generations.get(restaurant_id, 0) + 1
+            metrics = self._metrics.get(restaurant_id)
+            if metrics is not None:
+                for key in metrics:
+                    metrics[key] += new[key] - old[key]
+                metrics["revenue_24h"] = round(metrics["revenue_24h"], 2)
+
+        # Other workers cannot replay the change, so they resync on their next poll
+        if broadcast:
+            cache_bus.publish_invalidation("order_metrics", restaurant_id)
+
+    def invalidate(self, restaurant_id: str):
+        with self._lock:
+            # Also marks a load in flight as stale, since another worker changed an order
+            self._generations[restaurant_id] = self._generations.get(restaurant_id, 0) + 1
+            self._metrics.pop(restaurant_id, None)
+            self._synced_at.pop(restaurant_id, None)
+
+order_metrics = OrderMetrics()
+
+cache_bus.register_handler("order_metrics", order_metrics.invalidate)
+cache_bus.register_handler("restaurant", order_metrics.invalidate)
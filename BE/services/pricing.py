@@ -0,0 +1,149 @@
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+class PricingError(ValueError):
+    """A cart line that cannot be priced (unknown item, size or serving)"""
+
+def _cents(value: Any) -> int:
+    return int(round(float(value or 0) * 100))
+
+def _to_money(cents: int) -> Decimal:
+    return Decimal(int(cents)) / 100
+
+def whole_quantity(value: Any) -> int:
+    """A positive whole-number quantity; 2.0 is accepted, 2.7, 0 and True are not"""
+    if isinstance(value, bool):
+        raise PricingError("Quantity must be a positive whole number")
+    if isinstance(value, str):
+        value = value.strip()
+    try:
+        number = Decimal(str(value))
+    except Exception:
+        raise PricingError("Quantity must be a positive whole number")
+    if not number.is_finite() or number != number.to_integral_value() or number <= 0:
+        raise PricingError("Quantity must be a positive whole number")
+    return int(number)
+
+def _option_index(options: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Option name -> column in the item's price table (0 is the default)"""
+    return {str(option.get("name", "")).strip().lower(): i + 1 for i, option in enumerate(options)}
+
+class PriceTable:
+    """Compiled prices for the available menu items of one menu revision.
+
+    Every (size, serving) combination of every item is precomputed in integer
+    cents, so pricing a cart is array indexing plus one deal comparison
+    matrix. Index 0 of sizes is the base price and index 0 of servings is a
+    1x multiplier, which is what a line gets when it names neither.
+    """
+
+    def __init__(self, items: List[Dict[str, Any]]):
+        self.ids = [entry["id"] for entry in items]
+        self.positions = {item_id: i for i, item_id in enumerate(self.ids)}
+        self.size_index = []
+        self.serving_index = []
+
+        offsets, serving_counts, unit_cents = [], [], []
+        deal_items, deal_min, deal_pct, deal_amount, self.deal_names = [], [], [], [], []
+        for position, entry in enumerate(items):
+            sizes = np.array([_cents(entry["price"])] + [_cents(size.get("price")) for size in entry["sizes"]], dtype=np.int64)
+            multipliers = np.array([1.0] + [float(serving.get("price_multiplier") or 1) for serving in entry["servings"]])
+            self.size_index.append(_option_index(entry["sizes"]))
+            self.serving_index.append(_option_index(entry["servings"]))
+
+            offsets.append(sum(len(table) for table in unit_cents))
+            serving_counts.append(len(multipliers))
+            unit_cents.append(np.rint(np.outer(sizes, multipliers)).astype(np.int64).ravel())
+
+            for deal in entry["deals"]:
+                deal_items.append(position)
+                deal_min.append(int(deal.get("min_quantity") or 1))
+                deal_pct.append(float(deal.get("discount_percentage") or 0))
+                deal_amount.append(_cents(deal.get("discount_amount")))
+                self.deal_names.append(deal.get("name"))
+
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.serving_counts = np.array(serving_counts, dtype=np.int64)
+        self.unit_cents = np.concatenate(unit_cents) if unit_cents else np.zeros(0, dtype=np.int64)
+        self.deal_items = np.array(deal_items, dtype=np.int64)
+        self.deal_min = np.array(deal_min, dtype=np.int64)
+        self.deal_pct = np.array(deal_pct, dtype=np.float64)
+        self.deal_amount = np.array(deal_amount, dtype=np.int64)
+
+    def serving_prices(self, item_id: str) -> List[Decimal]:
+        """Base-size price of each serving option of an item"""
+        position = self.positions[item_id]
+        start = self.offsets[position] + 1
+        return [_to_money(cents) for cents in self.unit_cents[start:start + self.serving_counts[position] - 1]]
+
+    def _resolve(self, lines: List[Dict[str, Any]]):
+        positions, sizes, servings, quantities = [], [], [], []
+        for line in lines:
+            item_id = str(line.get("menu_item_id")).strip().lower()
+            position = self.positions.get(item_id)
+            if position is None:
+                raise PricingError(f"Menu item {item_id} not found or unavailable")
+
+            try:
+                quantity = whole_quantity(line.get("quantity"))
+            except PricingError:
+                raise PricingError(f"Quantity for menu item {item_id} must be a positive whole number")
+
+            size = self._option(self.size_index[position], line.get("size"), "size", item_id)
+            serving = self._option(self.serving_index[position], line.get("serving"), "serving", item_id)
+            positions.append(position)
+            sizes.append(size)
+            servings.append(serving)
+            quantities.append(quantity)
+
+        return (np.array(positions, dtype=np.int64), np.array(sizes, dtype=np.int64),
+                np.array(servings, dtype=np.int64), np.array(quantities, dtype=np.int64))
+
+    @staticmethod
+    def _option(index: Dict[str, int], name: Optional[str], kind: str, item_id: str) -> int:
+        if not name:
+            return 0
+        column = index.get(str(name).strip().lower())
+        if column is None:
+            raise PricingError(f"Unknown {kind} '{name}' for menu item {item_id}")
+        return column
+
+    def price_cart(self, lines: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Price every line of a cart in one pass.
+
+        Each line is ``{"menu_item_id", "quantity", "size"?, "serving"?}``.
+        The best eligible deal (by discount) is applied per line. Raises
+        PricingError for lines that cannot be priced.
+        """
+        if not lines:
+            raise PricingError("An order needs at least one item")
+        positions, sizes, servings, quantities = self._resolve(lines)
+
+        unit = self.unit_cents[self.offsets[positions] + sizes * self.serving_counts[positions] + servings]
+        gross = unit * quantities
+
+        discount = np.zeros(len(lines), dtype=np.int64)
+        deal = np.full(len(lines), -1, dtype=np.int64)
+        if self.deal_items.size:
+            eligible = (self.deal_items[None, :] == positions[:, None]) & (quantities[:, None] >= self.deal_min[None, :])
+            candidates = np.maximum(np.rint(gross[:, None] * self.deal_pct[None, :] / 100).astype(np.int64), self.deal_amount[None, :])
+            candidates = np.where(eligible, np.minimum(candidates, gross[:, None]), 0)
+            best = candidates.argmax(axis=1)
+            discount = candidates[np.arange(len(lines)), best]
+            deal = np.where(discount > 0, best, -1)
+
+        net = gross - discount
+        return {
+            "lines": [{
+                "menu_item_id": self.ids[positions[i]],
+                "quantity": int(quantities[i]),
+                "size": lines[i].get("size") if sizes[i] else None,
+                "serving": lines[i].get("serving") if servings[i] else None,
+                "unit_price": _to_money(unit[i]),
+                "discount": _to_money(discount[i]),
+                "deal": self.deal_names[deal[i]] if deal[i] >= 0 else None,
+                "line_total": _to_money(net[i])
+            } for i in range(len(lines))],
+            "total": _to_money(net.sum())
+        }
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from dotenv import load_dotenv
+
+from models.main_models import Restaurant
+from database.main_db import MainAsyncSessionLocal
+from database.tenant_db import prewarm_tenant_dbs
+from services import cache_bus
+
+load_dotenv()
+
+RESTAURANT_CACHE_TTL = int(os.getenv("RESTAURANT_CACHE_TTL", 300))  # seconds
+
+# Tenants opened at startup: explicit slugs, else the restaurants with the latest chat traffic
+TENANT_PREWARM_SLUGS = [slug.strip() for slug in os.getenv("TENANT_PREWARM_SLUGS", "").split(",") if slug.strip()]
+TENANT_PREWARM_COUNT = int(os.getenv("TENANT_PREWARM_COUNT", 10))
+TENANT_PREWARM_TIMEOUT = float(os.getenv("TENANT_PREWARM_TIMEOUT", 20))  # seconds
+# restaurants.last_active_at is written at most this often per restaurant and worker
+RESTAURANT_ACTIVITY_INTERVAL = int(os.getenv("RESTAURANT_ACTIVITY_INTERVAL", 300))  # seconds
+
+# Strong references to activity writes so they are not garbage-collected mid-run
+_activity_tasks = set()
+
+def restaurant_to_entry(restaurant: Restaurant) -> Dict[str, Any]:
+    """Snapshot the fields tenant requests need from a Restaurant row"""
+    return {
+        "id": str(restaurant.id),
+        "slug": restaurant.slug,
+        "name": restaurant.name,
+        "description": restaurant.description,
+        "location": restaurant.location,
+        "image_url": restaurant.image_url,
+        "db_url": restaurant.db_url,
+        "gemini_api_key": restaurant.gemini_api_key,
+        "cloudinary_config": json.loads(restaurant.cloudinary_config) if restaurant.cloudinary_config else {}
+    }
+
+class RestaurantDirectory:
+    """TTL cache of restaurant entries addressable by slug and by id"""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._by_slug: Dict[str, Tuple[Dict[str, Any], float]] = {}
+        self._by_id: Dict[str, Tuple[Dict[str, Any], float]] = {}
+        self._listing: Optional[Tuple[List[Dict[str, Any]], float]] = None
+        self._activity_written: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    async def get_by_slug(self, slug: str, main_db: AsyncSession) -> Optional[Dict[str, Any]]:
+        entry = self._lookup(self._by_slug, slug)
+        if entry is not None:
+            return entry
+
+        result = await main_db.execute(select(Restaurant).filter(Restaurant.slug == slug))
+        return self._store(result.scalars().first())
+
+    async def get_by_id(self, restaurant_id: str, main_db: AsyncSession) -> Optional[Dict[str, Any]]:
+        entry = self._lookup(self._by_id, restaurant_id)
+        if entry is not None:
+            return entry
+
+        result = await main_db.execute(select(Restaurant).filter(Restaurant.id == restaurant_id))
+        return self._store(result.scalars().first())
+
+    async def get_all(self, main_db: AsyncSession) -> List[Dict[str, Any]]:
+        """Every restaurant, cached as a whole until any restaurant changes"""
+        listing = self._listing
+        if listing is not None and listing[1] >= time.monotonic():
+            return listing[0]
+
+        result = await main_db.execute(select(Restaurant))
+        entries = [self._store(restaurant) for restaurant in result.scalars().all()]
+        with self._lock:
+            self._listing = (entries, time.monotonic() + self.ttl)
+        return entries
+
+    async def load_many(self, main_db: AsyncSession, slugs: Optional[List[str]] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """Cache several restaurants in one query, by slug or most recent chat traffic"""
+        query = select(Restaurant)
+        if slugs:
+            query = query.filter(Restaurant.slug.in_(slugs))
+        else:
+            query = query.order_by(
+                Restaurant.last_active_at.desc().nullslast(), Restaurant.created_at.desc()
+            ).limit(limit)
+        result = await main_db.execute(query)
+        return [self._store(restaurant) for restaurant in result.scalars().all()]
+
+    def record_activity(self, restaurant_id: str):
+        """Note chat traffic for a restaurant, writing last_active_at in the background when due"""
+        now = time.monotonic()
+        with self._lock:
+            written = self._activity_written.get(restaurant_id)
+            if written is not None and now - written < RESTAURANT_ACTIVITY_INTERVAL:
+                return
+            self._activity_written[restaurant_id] = now
+
+        task = asyncio.create_task(_write_activity(restaurant_id))
+        _activity_tasks.add(task)
+        task.add_done_callback(_activity_tasks.discard)
+
+    def invalidate(self, restaurant_id: str, broadcast: bool = True):
+        """Drop a restaurant from the cache, optionally on every worker"""
+        self._evict(restaurant_id)
+        if broadcast:
+            cache_bus.publish_invalidation("restaurant", restaurant_id)
+
+    def clear(self):
+        with self._lock:
+            self._by_slug.clear()
+            self._by_id.clear()
+            self._listing = None
+
+    def _lookup(self, index: Dict[str, Tuple[Dict[str, Any], float]], key: str) -> Optional[Dict[str, Any]]:
+        cached = index.get(key)
+        if cached is None:
+            return None
+        entry, expires_at = cached
+        if expires_at < time.monotonic():
+            self._evict(entry["id"])
+            return None
+        return entry
+
+    def _store(self, restaurant: Optional[Restaurant]) -> Optional[Dict[str, Any]]:
+        if restaurant is None:
+            return None
+        entry = restaurant_to_entry(restaurant)
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._by_slug[entry["slug"]] = (entry, expires_at)
+            self._by_id[entry["id"]] = (entry, expires_at)
+        return entry
+
+    def _evict(self, restaurant_id: str):
+        with self._lock:
+            self._listing = None
+            cached = self._by_id.pop(restaurant_id, None)
+            if cached is not None:
+                self._by_slug.pop(cached[0]["slug"], None)
+
+restaurant_directory = RestaurantDirectory(ttl=RESTAURANT_CACHE_TTL)
+
+async def _write_activity(restaurant_id: str):
+    main_db = MainAsyncSessionLocal()
+    try:
+        # Keep updated_at as is: it tracks configuration edits, not traffic
+        await main_db.execute(
+            update(Restaurant).where(Restaurant.id == restaurant_id)
+            .values(last_active_at=datetime.utcnow(), updated_at=Restaurant.updated_at)
+        )
+        await main_db.commit()
+    except Exception as e:
+        print(f"Failed to record restaurant activity: {str(e)}")
+    finally:
+        await main_db.close()
+
+async def prewarm_tenants():
+    """Load directory entries and open tenant pools before serving traffic"""
+    if not TENANT_PREWARM_SLUGS and TENANT_PREWARM_COUNT <= 0:
+        return
+
+    main_db = MainAsyncSessionLocal()
+    try:
+        entries = await restaurant_directory.load_many(main_db, TENANT_PREWARM_SLUGS, TENANT_PREWARM_COUNT)
+    finally:
+        await main_db.close()
+
+    try:
+        await asyncio.wait_for(
+            prewarm_tenant_dbs([entry["db_url"] for entry in entries]),
+            timeout=TENANT_PREWARM_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        # Whatever finished stays warm; the rest connect on first request
+        print(f"Tenant prewarm timed out after {TENANT_PREWARM_TIMEOUT}s")
+
+cache_bus.register_handler(
+    "restaurant", lambda restaurant_id: restaurant_directory.invalidate(restaurant_id, broadcast=False)
+)
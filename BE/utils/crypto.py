@@ -0,0 +1,103 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+import bcrypt
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+
+load_dotenv()
+
+# bcrypt releases the GIL, so threads are enough; "process" isolates it completely
+CRYPTO_EXECUTOR = os.getenv("CRYPTO_EXECUTOR", "thread")  # thread | process
+CRYPTO_WORKERS = int(os.getenv("CRYPTO_WORKERS", min(4, os.cpu_count() or 1)))
+# Hashes queued beyond the running ones; further requests are refused instead of piling up
+CRYPTO_MAX_QUEUE = int(os.getenv("CRYPTO_MAX_QUEUE", 32))
+
+def _hash_secret(secret: str) -> str:
+    return bcrypt.hashpw(secret.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+def _verify_secret(secret: str, hashed: str) -> bool:
+    return bcrypt.checkpw(secret.encode('utf-8'), hashed.encode('utf-8'))
+
+class CryptoExecutor:
+    """Bounded worker pool for password and OTP hashing, kept off the event loop.
+
+    At most ``workers`` hashes run at once and ``max_queue`` wait behind them;
+    past that, callers get a 503 so a login burst cannot build an unbounded
+    backlog.
+    """
+
+    def __init__(self, workers: int = CRYPTO_WORKERS, max_queue: int = CRYPTO_MAX_QUEUE, kind: str = CRYPTO_EXECUTOR):
+        self.workers = max(workers, 1)
+        self.max_queue = max_queue
+        self.kind = kind
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._peak_queue_depth = 0
+        self._completed = 0
+        self._rejected = 0
+        self._latency_ms = 0.0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="crypto")
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        with self._lock:
+            if self._in_flight - self.workers >= self.max_queue:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many authentication requests, please retry shortly",
+                    headers={"Retry-After": "1"}
+                )
+            self._in_flight += 1
+            self._peak_queue_depth = max(self._peak_queue_depth, self._in_flight - self.workers)
+            executor = self._get_executor()
+
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._completed += 1
+                self._latency_ms += (time.perf_counter() - started) * 1000
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "executor": self.kind,
+                "workers": self.workers,
+                "in_flight": self._in_flight,
+                "queue_depth": max(self._in_flight - self.workers, 0),
+                "peak_queue_depth": self._peak_queue_depth,
+                "max_queue": self.max_queue,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_latency_ms": round(self._latency_ms / self._completed, 1) if self._completed else 0.0
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+crypto_executor = CryptoExecutor()
+
+async def hash_secret(secret: str) -> str:
+    """bcrypt hash of a password or OTP, computed in the crypto pool"""
+    return await crypto_executor.run(_hash_secret, secret)
+
+async def verify_secret(secret: str, hashed: str) -> bool:
+    """Check a password or OTP against its bcrypt hash in the crypto pool"""
+    return await crypto_executor.run(_verify_secret, secret, hashed)
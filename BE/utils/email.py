@@ -1,20 +1,166 @@
-import smtplib
+import asyncio
+import os
+import random
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-import os
+from typing import List, Optional
+import aiosmtplib
 from dotenv import load_dotenv
 
+from utils.otp_store import OTP_TTL_SECONDS
+
 load_dotenv()
 
 EMAIL_HOST = os.getenv("EMAIL_HOST", "smtp.gmail.com")
 EMAIL_PORT = int(os.getenv("EMAIL_PORT", 587))
 EMAIL_USER = os.getenv("EMAIL_USER")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
+EMAIL_FROM = os.getenv("EMAIL_FROM", EMAIL_USER)
+# Set to false (and leave EMAIL_USER/EMAIL_PASSWORD unset) for a local stand-in such as aiosmtpd
+EMAIL_STARTTLS = os.getenv("EMAIL_STARTTLS", "true").lower() == "true"
+EMAIL_TIMEOUT_SECONDS = float(os.getenv("EMAIL_TIMEOUT_SECONDS", 10))
+
+EMAIL_OUTBOX_SIZE = int(os.getenv("EMAIL_OUTBOX_SIZE", 1000))
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", 20))  # messages sent per connection round
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", 5))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", 2))
+# Idle SMTP connections are closed before the server drops them
+EMAIL_IDLE_SECONDS = float(os.getenv("EMAIL_IDLE_SECONDS", 60))
+
+class OutgoingEmail:
+    """A queued message and how many delivery attempts it has had"""
+
+    def __init__(self, message: MIMEMultipart):
+        self.message = message
+        self.attempts = 0
+
+class EmailOutbox:
+    """In-process outbox drained by one background worker.
+
+    The worker keeps a single SMTP connection open between messages, sends
+    whatever is queued in batches of up to EMAIL_BATCH_SIZE, and re-queues
+    failed messages with exponential backoff. Permanent (5xx) rejections are
+    dropped after logging.
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._smtp: Optional[aiosmtplib.SMTP] = None
+        self._retries: List[asyncio.TimerHandle] = []
+
+    def start(self):
+        if self._worker is None:
+            self._queue = asyncio.Queue(maxsize=EMAIL_OUTBOX_SIZE)
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10):
+        """Give queued messages a moment to go out, then stop the worker"""
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Email outbox stopped with {self._queue.qsize()} message(s) unsent")
+        for handle in self._retries:
+            handle.cancel()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        await self._disconnect()
+
+    def enqueue(self, message: MIMEMultipart):
+        """Queue a message for delivery without waiting for SMTP"""
+        if self._queue is None:
+            raise RuntimeError("Email outbox is not running")
+        self._queue.put_nowait(OutgoingEmail(message))
+
+    async def _run(self):
+        while True:
+            try:
+                email = await asyncio.wait_for(self._queue.get(), EMAIL_IDLE_SECONDS)
+            except asyncio.TimeoutError:
+                await self._disconnect()
+                continue
+
+            batch = [email]
+            while len(batch) < EMAIL_BATCH_SIZE and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            for email in batch:
+                try:
+                    await self._deliver(email)
+                finally:
+                    self._queue.task_done()
+
+    async def _deliver(self, email: OutgoingEmail):
+        email.attempts += 1
+        try:
+            smtp = await self._connect()
+            await smtp.send_message(email.message)
+            print(f"Email sent to {email.message['To']}")
+        except Exception as e:
+            if isinstance(e, aiosmtplib.SMTPResponseException) and 500 <= e.code < 600:
+                print(f"Email to {email.message['To']} rejected permanently: {str(e)}")
+                return
+            # The connection may be broken; reconnect for the next message
+            await self._disconnect()
+            if email.attempts >= EMAIL_MAX_ATTEMPTS:
+                print(f"Giving up on email to {email.message['To']} after {email.attempts} attempts: {str(e)}")
+                return
+            delay = EMAIL_RETRY_BASE_SECONDS * 2 ** (email.attempts - 1) * random.uniform(0.8, 1.2)
+            print(f"Email to {email.message['To']} failed ({str(e)}), retrying in {delay:.1f}s")
+            self._schedule_retry(email, delay)
+
+    def _schedule_retry(self, email: OutgoingEmail, delay: float):
+        def requeue():
+            self._retries.remove(handle)
+            try:
+                self._queue.put_nowait(email)
+            except asyncio.QueueFull:
+                print(f"Email outbox full, dropping retry to {email.message['To']}")
+
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._retries.append(handle)
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        if self._smtp is not None and self._smtp.is_connected:
+            return self._smtp
+        smtp = aiosmtplib.SMTP(
+            hostname=EMAIL_HOST,
+            port=EMAIL_PORT,
+            start_tls=EMAIL_STARTTLS,
+            timeout=EMAIL_TIMEOUT_SECONDS
+        )
+        await smtp.connect()
+        if EMAIL_USER and EMAIL_PASSWORD:
+            await smtp.login(EMAIL_USER, EMAIL_PASSWORD)
+        self._smtp = smtp
+        return smtp
+
+    async def _disconnect(self):
+        smtp, self._smtp = self._smtp, None
+        if smtp is not None and smtp.is_connected:
+            try:
+                await smtp.quit()
+            except Exception:
+                smtp.close()
+
+email_outbox = EmailOutbox()
+
+async def start_email_outbox():
+    email_outbox.start()
+
+async def stop_email_outbox():
+    await email_outbox.stop()
 
 async def send_otp_email(recipient_email: str, otp_code: int, restaurant_name: str):
-    """Send OTP email to restaurant admin"""
+    """Queue the OTP email to a restaurant admin; delivery happens in the background"""
     
-    if not EMAIL_USER or not EMAIL_PASSWORD:
+    if not EMAIL_FROM:
         raise ValueError("Email configuration not set")
     
     subject = f"Login OTP for {restaurant_name}"
@@ -25,7 +171,7 @@ async def send_otp_email(recipient_email: str, otp_code: int, restaurant_name: s
     
     {otp_code}
     
-    This code will expire in 10 minutes.
+    This code will expire in {OTP_TTL_SECONDS // 60} minutes.
     
     If you didn't request this login, please ignore this email.
     
@@ -34,20 +180,10 @@ async def send_otp_email(recipient_email: str, otp_code: int, restaurant_name: s
     """
     
     msg = MIMEMultipart()
-    msg['From'] = EMAIL_USER
+    msg['From'] = EMAIL_FROM
     msg['To'] = recipient_email
     msg['Subject'] = subject
     
     msg.attach(MIMEText(body, 'plain'))
     
-    try:
-        server = smtplib.SMTP(EMAIL_HOST, EMAIL_PORT)
-        server.starttls()
-        server.login(EMAIL_USER, EMAIL_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(EMAIL_USER, recipient_email, text)
-        server.quit()
-        print(f"OTP email sent successfully to {recipient_email}")
-    except Exception as e:
-        print(f"Failed to send OTP email: {str(e)}")
-        raise e
\ No newline at end of file
+    email_outbox.enqueue(msg)
@@ -0,0 +1,41 @@
+import hashlib
+import json
+import os
+from typing import Any, Optional
+from fastapi import Request, Response
+
+# Public payloads may be reused briefly, then revalidated with If-None-Match
+PUBLIC_CACHE_MAX_AGE = int(os.getenv("PUBLIC_CACHE_MAX_AGE", 30))  # seconds
+PUBLIC_CACHE_STALE_WHILE_REVALIDATE = int(os.getenv("PUBLIC_CACHE_STALE_WHILE_REVALIDATE", 300))
+
+def json_body(payload: Any) -> bytes:
+    """Serialize the way FastAPI's JSONResponse does"""
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def make_etag(body: bytes) -> str:
+    """ETag from the response body; identical on every worker.
+
+    Weak, because the compression middleware may gzip the body after it is
+    tagged, and a strong tag must change with the encoded bytes.
+    """
+    return 'W/"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match comparison (weak, as RFC 9110 requires for GET)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in tags)
+
+def cached_json_response(request: Request, body: bytes, etag: Optional[str] = None) -> Response:
+    """JSON response carrying ETag/Cache-Control, or 304 when the client copy is current"""
+    etag = etag or make_etag(body)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={PUBLIC_CACHE_MAX_AGE}, stale-while-revalidate={PUBLIC_CACHE_STALE_WHILE_REVALIDATE}"
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
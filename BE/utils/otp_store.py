@@ -0,0 +1,108 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from typing import Dict, Tuple
+from dotenv import load_dotenv
+
+from utils.redis_client import get_redis, WEB_CONCURRENCY
+
+load_dotenv()
+
+OTP_TTL_SECONDS = int(os.getenv("OTP_TTL_SECONDS", 600))
+OTP_MAX_ATTEMPTS = int(os.getenv("OTP_MAX_ATTEMPTS", 5))
+OTP_STORE_BACKEND = os.getenv("OTP_STORE_BACKEND", "auto")  # auto (redis when configured) | memory | redis
+OTP_SECRET = (os.getenv("OTP_SECRET") or os.getenv("JWT_SECRET_KEY", "your-secret-key")).encode('utf-8')
+
+def otp_digest(restaurant_id: str, code: str) -> str:
+    """Keyed digest of a code, bound to the restaurant it was issued for"""
+    return hmac.new(OTP_SECRET, f"{restaurant_id}:{code.strip()}".encode('utf-8'), hashlib.sha256).hexdigest()
+
+class InMemoryOTPStore:
+    """One pending OTP per restaurant in process memory; suitable for a single worker"""
+
+    def __init__(self):
+        # restaurant_id -> (digest, expires_at, attempts)
+        self._codes: Dict[str, Tuple[str, float, int]] = {}
+        self._lock = threading.Lock()
+
+    async def issue(self, restaurant_id: str, code: str):
+        """Store a new code, replacing any earlier one"""
+        with self._lock:
+            self._purge_expired()
+            self._codes[restaurant_id] = (otp_digest(restaurant_id, code), time.monotonic() + OTP_TTL_SECONDS, 0)
+
+    async def verify(self, restaurant_id: str, code: str) -> bool:
+        """Check and consume a code; it is dropped once used or out of attempts"""
+        digest = otp_digest(restaurant_id, code)
+        with self._lock:
+            entry = self._codes.get(restaurant_id)
+            if entry is None:
+                return False
+            stored, expires_at, attempts = entry
+            if expires_at < time.monotonic() or attempts >= OTP_MAX_ATTEMPTS:
+                del self._codes[restaurant_id]
+                return False
+            if hmac.compare_digest(stored, digest):
+                del self._codes[restaurant_id]
+                return True
+            self._codes[restaurant_id] = (stored, expires_at, attempts + 1)
+            return False
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        for restaurant_id in [key for key, (_, expires_at, _) in self._codes.items() if expires_at < now]:
+            del self._codes[restaurant_id]
+
+class RedisOTPStore:
+    """Pending OTPs shared by all workers, one expiring Redis hash per restaurant"""
+
+    def __init__(self, redis):
+        self.redis = redis
+
+    def _key(self, restaurant_id: str) -> str:
+        return f"otp:{restaurant_id}"
+
+    async def issue(self, restaurant_id: str, code: str):
+        key = self._key(restaurant_id)
+        pipe = self.redis.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping={"digest": otp_digest(restaurant_id, code), "attempts": 0})
+        pipe.expire(key, OTP_TTL_SECONDS)
+        await pipe.execute()
+
+    async def verify(self, restaurant_id: str, code: str) -> bool:
+        key = self._key(restaurant_id)
+        pipe = self.redis.pipeline()
+        pipe.hget(key, "digest")
+        pipe.hincrby(key, "attempts", 1)
+        stored, attempts = await pipe.execute()
+        if stored is None:
+            # HINCRBY created a stray hash; drop it
+            await self.redis.delete(key)
+            return False
+        if attempts > OTP_MAX_ATTEMPTS:
+            await self.redis.delete(key)
+            return False
+        if hmac.compare_digest(stored, otp_digest(restaurant_id, code)):
+            # Only the request that deletes the key gets in, so a code works once
+            return await self.redis.delete(key) == 1
+        return False
+
+_store = None
+
+def get_otp_store():
+    global _store
+    if _store is None:
+        redis = get_redis() if OTP_STORE_BACKEND != "memory" else None
+        if redis is not None:
+            _store = RedisOTPStore(redis)
+        else:
+            if OTP_STORE_BACKEND == "redis":
+                raise RuntimeError("OTP_STORE_BACKEND=redis requires REDIS_URL")
+            if WEB_CONCURRENCY > 1:
+                print(f"WARNING: OTPs are kept in process memory with {WEB_CONCURRENCY} workers; "
+                      "a code issued by one worker will fail on the others. Set REDIS_URL.")
+            _store = InMemoryOTPStore()
+    return _store
@@ -0,0 +1,54 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Optional, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import select, func, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Filtered "estimate" counts stop scanning after this many rows
+COUNT_ESTIMATE_CAP = 10000
+
+def encode_cursor(created_at: datetime, row_id) -> str:
+    """Encode a (created_at, id) position as an opaque URL-safe cursor"""
+    raw = json.dumps([created_at.isoformat(), str(row_id)]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(created_at, str) or not isinstance(row_id, str):
+            raise ValueError("cursor fields must be strings")
+        return datetime.fromisoformat(created_at), uuid.UUID(row_id)
+    except (ValueError, TypeError, AttributeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def keyset_filter(created_at_column, id_column, cursor: str, descending: bool = True):
+    """Row-value comparison selecting rows strictly after the cursor position"""
+    created_at, row_id = decode_cursor(cursor)
+    position = tuple_(created_at_column, id_column)
+    return position < (created_at, row_id) if descending else position > (created_at, row_id)
+
+async def estimate_table_rows(db: AsyncSession, table_name: str, schema: Optional[str] = None) -> int:
+    """Planner row estimate from pg_class; constant time regardless of table size"""
+    qualified = f'"{schema}".{table_name}' if schema else table_name
+    result = await db.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)"),
+        {"name": qualified}
+    )
+    estimate = result.scalar()
+    return max(int(estimate or 0), 0)
+
+async def count_rows(db: AsyncSession, query, cap: Optional[int] = None) -> int:
+    """Count the rows of a select, optionally stopping after ``cap`` rows"""
+    subquery = query.order_by(None)
+    if cap is not None:
+        subquery = subquery.limit(cap)
+    result = await db.execute(select(func.count()).select_from(subquery.subquery()))
+    return result.scalar() or 0
@@ -1,24 +1,129 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
-from datetime import datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, and_
+from datetime import datetime
+from typing import Dict
+import os
+import time
 from models.tenant_models import  TokenUsage
+from utils.rolling_window import RollingWindowCounter
+from utils.redis_client import get_redis
 
-RATE_LIMIT_TOKENS = 10000  # 10,000 tokens per 24 hours
+RATE_LIMIT_TOKENS = int(os.getenv("RATE_LIMIT_TOKENS", 10000))  # tokens per 24 hours
 RATE_LIMIT_HOURS = 24
+RATE_LIMIT_BUCKET_SECONDS = int(os.getenv("RATE_LIMIT_BUCKET_SECONDS", 3600))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "auto")  # auto (redis when configured) | memory | redis
+# In memory mode, session totals are re-read from token_usage this often to see other workers' usage
+RATE_LIMIT_RESYNC_SECONDS = int(os.getenv("RATE_LIMIT_RESYNC_SECONDS", 60))
 
-def check_rate_limit(db: Session, session_id: str) -> bool:
-    """Check if session is within rate limit"""
-    
-    # Calculate 24h window
-    now = datetime.utcnow()
-    window_start = now - timedelta(hours=RATE_LIMIT_HOURS)
-    
-    # Get token usage in last 24h
-    total_tokens = db.query(func.coalesce(func.sum(TokenUsage.tokens), 0)).filter(
-        and_(
-            TokenUsage.session_id == session_id,
-            TokenUsage.created_at >= window_start
+async def _load_buckets(db: AsyncSession, session_id: str, bucket_seconds: int, first_bucket: int) -> Dict[int, float]:
+    """Aggregate a session's recent token usage into time buckets (one query, used once per session)"""
+    window_start = datetime.utcfromtimestamp(first_bucket * bucket_seconds)
+    bucket = func.floor(func.extract('epoch', TokenUsage.created_at) / bucket_seconds)
+
+    result = await db.execute(
+        select(bucket, func.sum(TokenUsage.tokens)).filter(
+            and_(
+                TokenUsage.session_id == session_id,
+                TokenUsage.created_at >= window_start
+            )
+        ).group_by(bucket)
+    )
+    return {int(b): float(tokens) for b, tokens in result.all()}
+
+class InMemoryTokenCounter:
+    """Per-process hourly token buckets.
+
+    Buckets are reloaded from token_usage every RATE_LIMIT_RESYNC_SECONDS, so
+    with several workers the limit lags other workers' usage by at most that.
+    """
+
+    def __init__(self):
+        self.counter = RollingWindowCounter(
+            window_seconds=RATE_LIMIT_HOURS * 3600,
+            bucket_seconds=RATE_LIMIT_BUCKET_SECONDS
         )
-    ).scalar()
-    
-    return (total_tokens or 0) < RATE_LIMIT_TOKENS
\ No newline at end of file
+        self._seeded_at: Dict[tuple, float] = {}
+
+    async def total(self, db: AsyncSession, tenant_key: str, session_id: str) -> float:
+        key = (tenant_key, session_id)
+        seeded_at = self._seeded_at.get(key)
+        if key not in self.counter or seeded_at is None or time.monotonic() - seeded_at >= RATE_LIMIT_RESYNC_SECONDS:
+            buckets = await _load_buckets(db, session_id, self.counter.bucket_seconds, self.counter.first_bucket())
+            self.counter.seed(key, buckets)
+            self._seeded_at[key] = time.monotonic()
+            if len(self._seeded_at) > self.counter.max_keys:
+                # Forget sessions the counter itself has evicted
+                self._seeded_at = {k: t for k, t in self._seeded_at.items() if k in self.counter}
+        return self.counter.total(key)
+
+    async def record(self, tenant_key: str, session_id: str, tokens: int):
+        key = (tenant_key, session_id)
+        # Unseeded sessions pick these tokens up from token_usage on their next check
+        if key in self.counter:
+            self.counter.add(key, tokens)
+
+class RedisTokenCounter:
+    """Token buckets shared by all workers, one expiring Redis key per bucket"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.window_seconds = RATE_LIMIT_HOURS * 3600
+        self.bucket_seconds = RATE_LIMIT_BUCKET_SECONDS
+
+    def _prefix(self, tenant_key: str, session_id: str) -> str:
+        return f"ratelimit:{tenant_key}:{session_id}"
+
+    def _bucket_range(self):
+        now = time.time()
+        first = int((now - self.window_seconds) // self.bucket_seconds)
+        last = int(now // self.bucket_seconds)
+        return first, last
+
+    async def total(self, db: AsyncSession, tenant_key: str, session_id: str) -> float:
+        prefix = self._prefix(tenant_key, session_id)
+        first, last = self._bucket_range()
+
+        if not await self.redis.exists(f"{prefix}:seeded"):
+            buckets = await _load_buckets(db, session_id, self.bucket_seconds, first)
+            pipe = self.redis.pipeline()
+            for bucket, tokens in buckets.items():
+                pipe.set(f"{prefix}:{bucket}", int(tokens), ex=self.window_seconds + self.bucket_seconds)
+            pipe.set(f"{prefix}:seeded", 1, ex=self.window_seconds)
+            await pipe.execute()
+
+        values = await self.redis.mget([f"{prefix}:{bucket}" for bucket in range(first, last + 1)])
+        return sum(float(v) for v in values if v is not None)
+
+    async def record(self, tenant_key: str, session_id: str, tokens: int):
+        prefix = self._prefix(tenant_key, session_id)
+        key = f"{prefix}:{int(time.time() // self.bucket_seconds)}"
+        pipe = self.redis.pipeline()
+        pipe.incrby(key, tokens)
+        pipe.expire(key, self.window_seconds + self.bucket_seconds)
+        await pipe.execute()
+
+_counter = None
+
+def get_token_counter():
+    global _counter
+    if _counter is None:
+        redis = get_redis() if RATE_LIMIT_BACKEND != "memory" else None
+        if redis is not None:
+            _counter = RedisTokenCounter(redis)
+        else:
+            if RATE_LIMIT_BACKEND == "redis":
+                raise RuntimeError("RATE_LIMIT_BACKEND=redis requires REDIS_URL")
+            _counter = InMemoryTokenCounter()
+    return _counter
+
+async def check_rate_limit(db: AsyncSession, session_id: str, tenant_key: str = "") -> bool:
+    """Check if session is within rate limit"""
+
+    # Sum the session's token buckets for the last 24h
+    total_tokens = await get_token_counter().total(db, tenant_key, session_id)
+
+    return (total_tokens or 0) < RATE_LIMIT_TOKENS
+
+async def record_token_usage(session_id: str, tokens: int, tenant_key: str = ""):
+    """Add tokens to the session's current bucket after they are stored in token_usage"""
+    await get_token_counter().record(tenant_key, session_id, tokens)
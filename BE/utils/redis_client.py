@@ -0,0 +1,26 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL")
+# Worker processes serving the app (uvicorn/gunicorn convention); per-process state is not shared between them
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+
+_client = None
+
+def get_redis():
+    """Shared asyncio Redis client, or None when REDIS_URL is not configured"""
+    global _client
+    if not REDIS_URL:
+        return None
+    if _client is None:
+        import redis.asyncio as aioredis
+        _client = aioredis.from_url(REDIS_URL, decode_responses=True)
+    return _client
+
+async def close_redis():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
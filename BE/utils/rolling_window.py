@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+class RollingWindowCounter:
+    """Per-key sums over a sliding time window, stored as fixed-size time buckets.
+
+    Reads and writes cost O(buckets) regardless of how many events were
+    recorded. The window is aligned to bucket boundaries, so the oldest
+    bucket may include up to one bucket of events older than the window.
+    """
+
+    def __init__(self, window_seconds: int, bucket_seconds: int, max_keys: int = 100000):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, Dict[int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def bucket_of(self, timestamp: float) -> int:
+        return int(timestamp // self.bucket_seconds)
+
+    def first_bucket(self, now: Optional[float] = None) -> int:
+        """Oldest bucket index still inside the window"""
+        now = time.time() if now is None else now
+        return self.bucket_of(now - self.window_seconds)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._buckets
+
+    def seed(self, key: Hashable, buckets: Dict[int, float]):
+        """Load pre-aggregated bucket totals for a key"""
+        with self._lock:
+            self._buckets[key] = dict(buckets)
+            self._buckets.move_to_end(key)
+            self._trim()
+
+    def add(self, key: Hashable, amount: float, timestamp: Optional[float] = None):
+        timestamp = time.time() if timestamp is None else timestamp
+        bucket = self.bucket_of(timestamp)
+        with self._lock:
+            buckets = self._buckets.setdefault(key, {})
+            buckets[bucket] = buckets.get(bucket, 0) + amount
+            self._buckets.move_to_end(key)
+            self._prune(buckets, self.first_bucket(timestamp))
+            self._trim()
+
+    def total(self, key: Hashable, now: Optional[float] = None) -> float:
+        first = self.first_bucket(now)
+        with self._lock:
+            buckets = self._buckets.get(key)
+            if not buckets:
+                return 0
+            self._prune(buckets, first)
+            return sum(buckets.values())
+
+    def discard(self, key: Hashable):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def _prune(self, buckets: Dict[int, float], first: int):
+        for bucket in [b for b in buckets if b < first]:
+            del buckets[bucket]
+
+    def _trim(self):
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
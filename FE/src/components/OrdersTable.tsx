@@ -28,6 +28,8 @@ interface Order {
   updated_at: string;
   payment_proof_text?: string;
   payment_proof_image_url?: string;
+  payment_proof_hash?: string;
+  payment_proof_reused?: boolean;
   customer: Customer;
   items: OrderItem[];
 }
@@ -526,6 +528,9 @@ export default function OrdersTable({ limit }: OrdersTableProps) {
                 <div>
                   <h4 className="text-sm font-medium text-gray-900 mb-2">Payment Proof</h4>
                   <div className="bg-gray-50 rounded-lg p-4">
+                    {selectedOrder.payment_proof_reused && (
+                      <p className="mb-2 text-sm text-red-600">This proof image was also submitted for another order.</p>
+                    )}
                     {selectedOrder.payment_proof_text && (
                       <p className="mb-2">{selectedOrder.payment_proof_text}</p>
                     )}